@@ -0,0 +1,35 @@
+# The Bokeh server runs the functions in this file at fixed moments in its life, see
+# https://docs.bokeh.org/en/latest/docs/user_guide/server.html#lifecycle-hooks
+# main.py on the other hand is run for every new browser session.
+
+import metrics
+import settings
+import sync
+from catalog import shared_catalog
+from selection import shared_indexes
+
+
+def on_server_loaded(server_context):
+    """This builds the catalog and the indexes of the selection sliders once, when the server starts. Sessions then only
+    take a view of them, so that connecting is fast and the table is held in memory only once, however many users there are.
+    It also starts serving the metrics, if asked for (see metrics.py), and looking for updates of the archive (see sync.py)."""
+    shared_catalog()
+    shared_indexes()
+    if settings.METRICS_PORT:
+        metrics.serve_http()
+    if settings.SYNC_INTERVAL:
+        server_context.add_periodic_callback(sync.check_for_updates, settings.SYNC_INTERVAL*1000)
+
+
+def on_session_created(session_context):
+    """This runs before main.py, for every new session. If a newer catalog was published in the store by another process
+    (see store.py), the new session gets that one, and the open sessions are brought up to date (see sync.py). If the
+    snapshot has expired, the archive is queried again in the background. It also counts the sessions, for the metrics (see metrics.py)."""
+    sync.swap_and_notify()
+    sync.refresh_when_expired()
+    metrics.count('sessions_opened')
+    metrics.adjust('sessions_active', +1)
+
+
+def on_session_destroyed(session_context):
+    metrics.adjust('sessions_active', -1)
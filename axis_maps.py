@@ -0,0 +1,59 @@
+# The quantities that the population can be plotted against, in the Bokeh app (main.py) and in the batch renders of
+# render.py: the name of each axis, the column of the catalog that it shows, and its unit.
+
+axis_map = {
+    "Planet mass": "planetmass",
+    "Planet radius": "planetradius",
+    "Orbital period": "pl_orbper",
+    "Eccentricity":"pl_orbeccen",
+    "Equilibrium temperature": "teq",
+    "Stellar Effective Temperature": "st_teff",
+    "Density": "pl_dens",
+    "Gaia magnitude":"gaia_gmag",
+    "2MASS J magnitude":"st_j",
+    "Metallicity [Fe/H]":"st_metfe",
+    "Year of discovery": "pl_disc",
+    #These are derived columns, that are only computed when they are first plotted (see derived.py).
+    "Insolation": "insol",
+    "Surface gravity": "pl_grav",
+    "Transmission spectroscopy metric": "tsm",
+    "Emission spectroscopy metric": "esm",
+}
+unit_map = {
+    "Planet mass": "(Mj)",
+    "Planet radius": "(Rj)",
+    "Orbital period": "(d)",
+    "Eccentricity":"",
+    "Equilibrium temperature": "(K)",
+    "Stellar Effective Temperature": "(K)",
+    "Density": '(g/cm3)',
+    "Gaia magnitude":"",
+    "2MASS J magnitude":"",
+    "Metallicity [Fe/H]":"(dex)",
+    "Year of discovery": "",
+    "Insolation": "(Earth)",
+    "Surface gravity": "(m/s2)",
+    "Transmission spectroscopy metric": "",
+    "Emission spectroscopy metric": "",
+}
+#The planet mass and radius can be shown in Jupiter or in Earth units (see change_units() in main.py). These are the catalog columns
+#and axis labels that belong to each choice.
+unit_columns = {
+    "Jupiter": {"planetmass": "pl_massj", "planetradius": "pl_radj"},
+    "Earth": {"planetmass": "pl_masse", "planetradius": "pl_rade"},
+}
+unit_labels = {
+    "Jupiter": {"Planet mass": "(Mj)", "Planet radius": "(Rj)"},
+    "Earth": {"Planet mass": "(Me)", "Planet radius": "(Re)"},
+}
+
+
+def axis_column(axis, unit='Jupiter'):
+    """Returns the column of the catalog that the axis (e.g. "Planet mass") shows, in the units unit (Jupiter or Earth)."""
+    name = axis_map[axis]
+    return(unit_columns[unit].get(name, name))
+
+
+def axis_label(axis, unit='Jupiter'):
+    """Returns the label of the axis, with its unit, e.g. "Planet mass (Me)"."""
+    return((axis+' '+unit_labels[unit].get(axis, unit_map[axis])).strip())
@@ -0,0 +1,221 @@
+# Benchmarks of the hot paths of the app, on synthetic catalogs of increasing size (see synthetic.py).
+#
+# For each size, a synthetic catalog is written as a snapshot to a temporary directory, and a fresh Python process is
+# started that reads it in offline mode (so the archive is never queried, and every size starts with a clean process).
+# That process runs main.py headlessly on a Bokeh Document, the same way the Bokeh server does for a new session but
+# without a browser, and then changes the widgets like a user would. For every operation it measures:
+# - the wall time (the fastest and the median of --repeat runs),
+# - the peak memory allocated during the operation (with tracemalloc, in a separate run),
+# - the number of bytes that the Bokeh server would send to the browser as a result (the median of the runs).
+# Every run of an operation that changes a widget really changes it: the first run sets it to a value other than the
+# one it starts with. change_logscale_first is the first switch of the log scales of a new session, and
+# change_logscale the switches after that.
+#
+# The results are written as JSON, so that runs can be compared automatically. Usage:
+#     python benchmark.py [--rows 1000,10000,100000] [--repeat 5] [--output results.json]
+# Settings of the app are passed on to it, e.g. EXOPOP_AGGREGATE=1 python benchmark.py benchmarks the density mode.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from os.path import abspath, dirname
+
+APP_DIR = dirname(abspath(__file__))
+DEFAULT_ROWS = [1000, 10000, 100000, 1000000]
+
+
+def _measure(operation, repeat, setup=None):
+    """Runs operation() repeat times for the wall time, and once more under tracemalloc for the peak memory.
+    operation returns the number of bytes it made the server send. setup(), if given, runs before every run of operation,
+    without being timed."""
+    times, payloads = [], []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        payloads.append(operation())
+        times.append(time.perf_counter()-t0)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return({'wall_min_s': min(times), 'wall_median_s': statistics.median(times), 'peak_bytes': peak,
+            'payload_bytes': statistics.median(payloads)})
+
+
+class _Outbox(object):
+    """Collects the bytes of the messages that the Bokeh server would send for the changes to a document.
+
+    Changes made by the 'browser' (with set()) are not counted, because the server doesn't send those back."""
+
+    def __init__(self, doc):
+        from bokeh.protocol import Protocol
+        self.protocol = Protocol()
+        self.nbytes = 0
+        self.doc = doc
+        doc.on_change(self._count)
+
+    def _count(self, event):
+        if getattr(event, 'setter', None) is self:
+            return
+        #Serialised right away, because the event only refers to the model, which changes again later.
+        msg = self.protocol.create('PATCH-DOC', [event])
+        self.nbytes += len(msg.header_json)+len(msg.metadata_json)+len(msg.content_json)+sum(len(b) for h, b in msg.buffers)
+
+    def set(self, model, attr, value):
+        """Changes a property of a widget as if it was done in the browser, and returns the bytes sent in response."""
+        self.nbytes = 0
+        model.set_from_json(attr, value, setter=self)
+        return(self.nbytes)
+
+
+def run_benchmarks(repeat):
+    """Measures the operations on the snapshot in settings.CACHE_DIR. This runs in the process started by run_size()."""
+    from bokeh.application import Application
+    from bokeh.application.handlers import DirectoryHandler
+    from bokeh.models import CheckboxGroup, RadioGroup, RangeSlider, Select
+    from bokeh.protocol import Protocol
+    import catalog
+    import selection
+    import settings
+    import store
+
+    results = {}
+    def prep_table():
+        catalog.prep_table()
+        return(0)
+    results['prep_table'] = _measure(prep_table, repeat)
+    def build_indexes():
+        shared = catalog.shared_catalog()
+        for name in selection.FILTER_COLUMNS:
+            selection.build_index(shared[name])
+        return(0)
+    results['build_indexes'] = _measure(build_indexes, repeat)
+    selection.shared_indexes()#Built once, like on_server_loaded() does.
+    if settings.SHARED_STORE:#What another server process does instead of the above (see store.py).
+        def open_store():
+            store.open_store(store.current_name())
+            return(0)
+        results['open_store'] = _measure(open_store, repeat)
+    #A sweep over windows of Teq and radius, 1000 sets of criteria in one query (see selection.py).
+    sweep = [{'teq': (t, t+200), 'pl_rade': (r, 2*r), 'gaia_gmag': (None, 12)} for t in range(0, 3000, 30) for r in [1, 1.5, 2, 3, 4, 6, 8, 11, 15, 20]]
+    def batch_query():
+        selection.query_rows(sweep)
+        return(0)
+    results['batch_query'] = _measure(batch_query, repeat)
+
+    app = Application(DirectoryHandler(filename=APP_DIR))
+    docs = []
+    def new_session():
+        doc = app.create_document()
+        for handler in app.handlers:
+            if handler.failed:
+                raise RuntimeError('Could not build the app:\n%s' % handler.error_detail)
+        docs.append(doc)
+        msg = Protocol().create('PULL-DOC-REPLY', 'benchmark', doc)
+        return(len(msg.content_json)+sum(len(b) for h, b in msg.buffers))
+    results['new_session'] = _measure(new_session, repeat)
+
+    def widgets(doc):
+        return({getattr(m, 'title', None) or type(m).__name__: m for m in doc.select({'type': (Select, RangeSlider, RadioGroup, CheckboxGroup)})})
+    #The first switch of the log scales in a new session. setup() makes the session, which isn't timed.
+    fresh = {}
+    def new_document():
+        fresh['doc'] = app.create_document()
+        fresh['outbox'] = _Outbox(fresh['doc'])
+    def first_logscale():
+        return(fresh['outbox'].set(widgets(fresh['doc'])['CheckboxGroup'], 'active', [0, 1]))
+    results['change_logscale_first'] = _measure(first_logscale, repeat, setup=new_document)
+    fresh.clear()
+
+    doc = docs[-1]
+    outbox = _Outbox(doc)
+    found = widgets(doc)
+    #Every run changes the widget to the other of two values, so that each run really changes something. The first
+    #value differs from the one that the widget starts with.
+    toggles = {
+        'update': (found['X Axis'], 'value', ['Planet mass', 'Orbital period']),
+        'update_selection': (found['Equilibrium temperature'], 'value_throttled', [[1000, 1500], [0, 5000]]),
+        'change_units': (found['RadioGroup'], 'active', [1, 0]),
+        'change_logscale': (found['CheckboxGroup'], 'active', [[0, 1], [0]]),
+    }
+    outbox.set(found['CheckboxGroup'], 'active', [0, 1])#So that change_logscale only measures switches after the first.
+    outbox.set(found['CheckboxGroup'], 'active', [0])
+    for name, (model, attr, values) in toggles.items():
+        current = getattr(model, attr)
+        if (list(current) if isinstance(current, (list, tuple)) else current) == values[0]:
+            values = values[::-1]
+        state = {'i': 0}
+        def operation():
+            value = values[state['i'] % 2]
+            state['i'] += 1
+            return(outbox.set(model, attr, value))
+        results[name] = _measure(operation, repeat)
+    return(results)
+
+
+def run_size(rows, repeat, seed=0):
+    """Writes a synthetic catalog of the given number of rows to a temporary snapshot, and benchmarks it in a new
+    process. Returns the results of that process."""
+    import catalog
+    from synthetic import synthetic_catalog
+    path = tempfile.mkdtemp(prefix='exopop_benchmark_')
+    try:
+        catalog.write_snapshot(synthetic_catalog(rows, seed=seed), path)
+        env = dict(os.environ, EXOPOP_CACHE_DIR=path, EXOPOP_STORE_DIR=path+'_store', EXOPOP_OFFLINE='1')
+        out = subprocess.run([sys.executable, abspath(__file__), '--measure', '--repeat', str(repeat)], env=env,
+                             cwd=APP_DIR, stdout=subprocess.PIPE, check=True)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+        shutil.rmtree(path+'_store', ignore_errors=True)
+    return(json.loads(out.stdout.decode().strip().split('\n')[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the exoplanet population explorer on synthetic catalogs.')
+    parser.add_argument('--rows', default=','.join(str(n) for n in DEFAULT_ROWS), help='Comma-separated catalog sizes.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs of each operation.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic catalogs.')
+    parser.add_argument('--output', help='Write the results to this JSON file instead of to the screen.')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)#The process started by run_size().
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(run_benchmarks(args.repeat)))
+        return
+
+    import bokeh
+    import numpy as np
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'bokeh': bokeh.__version__,
+        'settings': {k: v for k, v in os.environ.items() if k.startswith('EXOPOP_')},
+        'repeat': args.repeat,
+        'results': [],
+    }
+    for rows in [int(n) for n in args.rows.split(',')]:
+        for operation, result in run_size(rows, args.repeat, args.seed).items():
+            result = dict(rows=rows, operation=operation, **result)
+            report['results'].append(result)
+            print('%9i rows  %-17s %9.4f s %12i B peak %12i B sent' % (rows, operation, result['wall_median_s'],
+                  result['peak_bytes'], result['payload_bytes']), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+# This module provides the exoplanet table to the Bokeh app (main.py) and to the matplotlib plot (plot.py).
+#
+# The archive table has hundreds of columns, of which only a handful are used. So right after it is downloaded,
+# it is projected onto the columns listed in COLUMNS, each converted to a fixed unit and stored as a plain, contiguous
+# numpy array. Missing values are NaN for numbers and '' for strings. The result is simply a dict of column name ->
+# array, which is what is meant by "the catalog" everywhere in this app. Quantities that are computed from these
+# columns, like the equilibrium temperature, are added to the catalog when they are first asked for (see derived.py).
+#
+# Querying the NASA Exoplanet Archive takes a while, so the first time the table is downloaded the catalog is written to
+# disk as a snapshot: one .npy file per column, plus a json file with the units and the time of the download. Every
+# snapshot has a folder of its own, and the file CURRENT names the one to read (see write_snapshot()).
+# Later starts read the snapshot instead. The archive is only queried again when the snapshot is older than
+# settings.CACHE_TTL, when a refresh is asked for explicitly, or never at all in offline mode.
+#
+# The Bokeh server runs main.py once for every browser session, but imports this module only once per process.
+# So the prepared catalog is kept here (see shared_catalog()), and all sessions read from that same copy.
+
+import json
+import os
+import shutil
+import threading
+import time
+from os.path import join
+
+import numpy as np
+
+import metrics
+import settings
+from derived import Catalog, UNITS as DERIVED_UNITS
+
+META_FILE = 'meta.json'
+CURRENT_FILE = 'CURRENT'
+SNAPSHOT_VERSION = 3#Snapshots written by older versions of this module are ignored, and refetched.
+
+#The archive columns that are kept, and the unit that each of them is stored in (None for unitless columns).
+COLUMNS = {
+    'pl_name': None,
+    'pl_tranflag': None,
+    'pl_massj': 'jupiterMass',
+    'pl_masse': 'earthMass',
+    'pl_radj': 'jupiterRad',
+    'pl_rade': 'earthRad',
+    'pl_orbper': 'd',
+    'pl_orbeccen': None,
+    'pl_orbsmax': 'AU',
+    'pl_dens': 'g / cm3',
+    'pl_disc': None,
+    'st_teff': 'K',
+    'st_rad': 'solRad',
+    'st_metfe': None,#dex
+    'st_spstr': None,
+    'gaia_gmag': None,#mag
+    'st_j': None,#mag
+    'st_k': None,#mag
+}
+STRING_COLUMNS = ['pl_name', 'st_spstr']
+
+#The appearance of the planets in the plot. These are the same for every planet, so they are not columns.
+STYLE = {
+    'colour': 'gray',
+    'selcolour': 'orange',
+    'alpha': 0.5,
+}
+
+
+def fetch_archive():
+    """This queries the NASA Exoplanet Archive over the network. It returns an astropy table with all columns."""
+    from astroquery.nasa_exoplanet_archive import NasaExoplanetArchive#Only needed when actually fetching.
+    return(NasaExoplanetArchive.get_confirmed_planets_table(all_columns=True))
+
+
+def _plain_column(col):
+    """Splits a table column (Column, MaskedColumn, Quantity or masked Quantity) into a plain array, a mask and a unit."""
+    mask = np.zeros(len(col), dtype=bool) if getattr(col, 'mask', None) is None else np.asarray(col.mask, dtype=bool)
+    unit = getattr(col, 'unit', None)
+    data = getattr(col, 'unmasked', col)#For masked quantities.
+    data = np.ma.getdata(getattr(data, 'value', data))#Strips the unit and the mask; what is left is a numpy array.
+    return(np.asarray(data), mask, unit)
+
+
+def project(table):
+    """This turns the archive table into a catalog: a dict with only the columns in COLUMNS, as plain numpy arrays
+    in the units given there. Masked values become NaN, or '' for strings."""
+    catalog = {}
+    for name, unit in COLUMNS.items():
+        data, mask, col_unit = _plain_column(table[name])
+        if name in STRING_COLUMNS:
+            data = data.astype(str)
+            data[mask] = ''
+        elif name == 'pl_tranflag':
+            data = data.astype(bool) & ~mask
+        else:
+            data = data.astype(np.float64)
+            if unit is not None and col_unit is not None and col_unit != unit:
+                data = (data * col_unit).to_value(unit)
+            data[mask] = np.nan
+        catalog[name] = np.ascontiguousarray(data)
+    return(catalog)
+
+
+def select_rows(catalog, rows):
+    """Returns a new catalog with only the given rows (a boolean mask or an array of indices) of every column.
+    Derived columns that were already computed are kept; the others are computed for the new catalog if asked for."""
+    return(Catalog({name: col[rows] for name, col in catalog.items()}))
+
+
+def snapshot_folder(path=settings.CACHE_DIR):
+    """Returns the folder of the current snapshot at path (see write_snapshot()). A snapshot written by an older version
+    of this module, before there was a file CURRENT, is in path itself."""
+    try:
+        with open(join(path, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return(path)
+    return(join(path, name) if name else path)
+
+
+def _from_current(read, path):
+    """Returns read(folder) for the folder of the current snapshot at path. If that folder is removed while it is read,
+    because newer snapshots were written meanwhile (see write_snapshot()), it is read from the newest one instead."""
+    while True:
+        folder = snapshot_folder(path)
+        try:
+            return(read(folder))
+        except FileNotFoundError:
+            if snapshot_folder(path) == folder:
+                raise
+
+
+def _read_meta(folder):
+    with open(join(folder, META_FILE)) as f:
+        return(json.load(f))
+
+
+def snapshot_fetched(path=settings.CACHE_DIR):
+    """Returns the time at which the snapshot at path was fetched, or None if there is no (complete, current) snapshot."""
+    try:
+        meta = _from_current(_read_meta, path)
+    except (OSError, ValueError):
+        return(None)
+    if meta.get('version') != SNAPSHOT_VERSION:
+        return(None)
+    return(meta['fetched'])
+
+
+def snapshot_age(path=settings.CACHE_DIR):
+    """Returns the age of the snapshot in seconds, or None if there is no (complete, current) snapshot at path."""
+    fetched = snapshot_fetched(path)
+    if fetched is None:
+        return(None)
+    return(time.time() - fetched)
+
+
+def write_snapshot(catalog, path=settings.CACHE_DIR):
+    """This writes a catalog to disk as a snapshot, column by column.
+
+    The columns are written into a new folder under path, and the file CURRENT is then replaced by one with the name of
+    that folder, like store.publish() does. Replacing a file is atomic, so a reader always finds a whole snapshot: the
+    old one or the new one. Processes that write a snapshot at the same time take turns for that last step."""
+    import store#Imported here, because store.py imports this module.
+    fetched = time.time()
+    name = 'snapshot-%.3f-%s' % (fetched, os.getpid())
+    tmp = join(path, name + '.tmp')
+    os.makedirs(tmp)
+    for column, col in catalog.items():
+        np.save(join(tmp, '%s.npy' % column), col, allow_pickle=False)
+    units = {column: COLUMNS.get(column, DERIVED_UNITS.get(column)) for column in catalog}
+    with open(join(tmp, META_FILE), 'w') as f:
+        json.dump({'version': SNAPSHOT_VERSION, 'fetched': fetched, 'units': units}, f)
+
+    with store.locked(path):
+        previous = snapshot_folder(path)
+        os.rename(tmp, join(path, name))
+        pointer = join(path, CURRENT_FILE + '.tmp%s' % os.getpid())
+        with open(pointer, 'w') as f:
+            f.write(name)
+        os.replace(pointer, join(path, CURRENT_FILE))
+        #Older snapshots can go, but the one before this one may still be being read.
+        for old in os.listdir(path):
+            if old.startswith('snapshot-') and not old.endswith('.tmp') and join(path, old) not in (previous, join(path, name)):
+                shutil.rmtree(join(path, old), ignore_errors=True)
+            elif old.endswith('.npy') or old == META_FILE:#A snapshot written before there was a file CURRENT.
+                os.remove(join(path, old))
+
+
+@metrics.timed('read_snapshot')
+def read_snapshot(path=settings.CACHE_DIR):
+    """This reads a snapshot written by write_snapshot() back into a catalog."""
+    def read(folder):
+        meta = _read_meta(folder)
+        return({name: np.load(join(folder, '%s.npy' % name), allow_pickle=False) for name in meta['units']})
+    return(_from_current(read, path))
+
+
+def load_catalog(refresh=settings.REFRESH, offline=settings.OFFLINE, ttl=settings.CACHE_TTL, path=settings.CACHE_DIR):
+    """This returns the catalog of confirmed planets, from the snapshot on disk if possible and from the archive if needed.
+
+    The archive is queried when there is no snapshot yet, when the snapshot is older than ttl seconds, or when
+    refresh is set. In offline mode the archive is never queried. If a query fails, an older snapshot is used
+    instead if there is one."""
+    age = snapshot_age(path)
+    if offline:
+        if age is None:
+            raise RuntimeError('Offline mode is on but there is no snapshot of the archive in %s. Run once with network access first.' % path)
+        return(read_snapshot(path))
+    if refresh or age is None or age > ttl:
+        try:
+            with metrics.stage('fetch_archive'):
+                catalog = project(fetch_archive())
+        except Exception as e:
+            if age is None:
+                raise
+            print('WARNING: Could not query the exoplanet archive (%s). Using the snapshot from %.1f hours ago.' % (e, age/3600.0))
+            return(read_snapshot(path))
+        write_snapshot(catalog, path)
+        return(catalog)
+    return(read_snapshot(path))
+
+
+@metrics.timed('prep_table')
+def prep_table():
+    """This is a wrapper for reading and augmenting the Exoplanet catalog to be suitable for interaction with bokeh.
+    It selects the transiting planets. The equilibrium temperature and the other derived columns are computed when
+    they are first asked for (see derived.py).
+
+    The planet mass and radius in the units chosen in the app (Jupiter or Earth) are not columns of this catalog,
+    because the choice of units differs between sessions. See change_units() in main.py."""
+    catalog = load_catalog()#Read from the local snapshot or from the archive.
+    transiting = select_rows(catalog, catalog['pl_tranflag'])#Select only the transiting ones, and put them in a new catalog.
+    return(transiting)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_catalog():
+    """Returns the prepared catalog. It is built only once per server process (the first time this is called, normally
+    by on_server_loaded() in app_hooks.py) and made read-only, because it is shared by all sessions.
+    With settings.SHARED_STORE, it is built only once per machine, and mapped into every process (see store.py)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            if settings.SHARED_STORE:
+                import store#Imported here, because store.py imports this module.
+                catalog = store.load()#Mapped read-only.
+            else:
+                fetched = snapshot_fetched()#Before reading it, so that a snapshot written meanwhile is swapped in later.
+                catalog = _freeze(prep_table())
+                catalog.fetched = fetched
+            catalog.readonly = True#And so will any attempt to write into derived columns computed later.
+            _shared = catalog
+    return(_shared)
+
+
+def _freeze(catalog):
+    for col in catalog.values():
+        col.setflags(write=False)#Any attempt by a session to write into the shared catalog now fails loudly.
+    return(catalog)
+
+
+def swap_in():
+    """Switches the shared catalog to the one that is current in the store, if another one was published since it was
+    mapped (see store.py). Without settings.SHARED_STORE, it is prepared again from the snapshot instead, if that was
+    written after the catalog was read (e.g. by sync.py). Sessions that start after this get the new catalog; sessions
+    that are open keep theirs. Returns True if the catalog was switched."""
+    global _shared
+    if not settings.SHARED_STORE:
+        return(_reload())
+    import store
+    name = store.current_name()
+    with _shared_lock:
+        if _shared is None or name is None or name == getattr(_shared, 'store_name', None):
+            return(False)
+        try:
+            _shared = store.open_store(name)
+        except (OSError, TypeError) as e:#Removed again already, by an even newer one.
+            print('WARNING: Could not map the catalog %s from the store (%s). Keeping the current one.' % (name, e))
+            return(False)
+    return(True)
+
+
+def _reload():
+    """swap_in() without the store: prepares the catalog again from the snapshot, if it is newer than the one the current
+    catalog was read from. The derived columns are only computed again for the planets that changed or were added."""
+    global _shared
+    from sync import prepare_update#Imported here, because sync.py imports this module.
+    fetched = snapshot_fetched()
+    with _shared_lock:
+        old = _shared
+        if old is None or fetched is None or fetched == getattr(old, 'fetched', None):
+            return(False)
+        try:
+            catalog = _freeze(prepare_update(old, read_snapshot()))
+        except (OSError, ValueError) as e:#Being replaced right now; it is read the next time.
+            print('WARNING: Could not read the new snapshot (%s). Keeping the current catalog.' % e)
+            return(False)
+        catalog.fetched = fetched
+        catalog.readonly = True
+        _shared = catalog
+    return(True)
+
+
+def session_view(shared=None):
+    """Returns a new catalog that refers to the same column arrays as the shared catalog (or the given one, which was
+    shared before), without copying them. A session can add its own columns to it without them showing up in the other
+    sessions. Derived columns are computed in the shared catalog, once for all sessions."""
+    if shared is None:
+        shared = shared_catalog()
+    return(Catalog(shared, parent=shared))
@@ -0,0 +1,134 @@
+# The client-side mode of the Bokeh app (settings.CLIENT_SIDE).
+#
+# In this mode, the browser gets the catalog once, as a single table, and everything else happens in the browser:
+# the eight selection sliders, the choice of axes, the log/linear switches and the units are handled by the
+# JavaScript callbacks below instead of by Python callbacks on the server. So after the page is loaded, the server has
+# nothing left to do, and the page can also be saved as a standalone HTML file that needs no Bokeh server at all
+# (see export_html.py).
+#
+# The JavaScript mirrors what update(), update_selection(), change_logscale() and change_units() in main.py do.
+# If you change those, change these too.
+
+from bokeh.models.callbacks import CustomJS
+
+#The columns of the catalog that are sent to the browser. These are all that the axes, filters and tooltips use.
+CLIENT_COLUMNS = ['pl_name', 'pl_massj', 'pl_masse', 'pl_radj', 'pl_rade', 'pl_orbper', 'pl_orbeccen', 'teq', 'st_teff',
+                  'pl_dens', 'gaia_gmag', 'st_j', 'st_metfe', 'pl_disc', 'insol', 'pl_grav', 'tsm', 'esm']
+
+#The tooltips in both unit systems. The browser swaps them when the units change.
+TOOLTIPS = {
+    'Jupiter': [("Name","@pl_name"),("Mass", "@pl_massj"),("Radius", "@pl_radj"),("P", "@pl_orbper d"),("Gmag/Jmag", "@gaia_gmag{0.0}/@st_j{0.0}"),("Teq", "@teq{0} K")],
+    'Earth': [("Name","@pl_name"),("Mass", "@pl_masse"),("Radius", "@pl_rade"),("P", "@pl_orbper d"),("Gmag/Jmag", "@gaia_gmag{0.0}/@st_j{0.0}"),("Teq", "@teq{0} K")],
+}
+
+
+def column_set(catalog):
+    """Returns the data of the single table that is sent to the browser."""
+    return({name: catalog[name] for name in CLIENT_COLUMNS})
+
+
+#Finds the planets that are within the ranges of all eight sliders, and shows only those in the highlighted layer.
+#Missing values are NaN, which fail every comparison, as they do in update_selection().
+FILTER_JS = """
+const d = source.data;
+const ranges = [
+    ['pl_massj', mass_ticks[mass.value[0]], mass_ticks[mass.value[1]]],
+    ['pl_radj', radius_ticks[rad.value[0]], radius_ticks[rad.value[1]]],
+    ['pl_orbper', 10**per.value[0], 10**per.value[1]],
+    ['pl_orbeccen', ecc.value[0], ecc.value[1]],
+    ['teq', teq.value[0], teq.value[1]],
+    ['st_teff', teff.value[0], teff.value[1]],
+    ['gaia_gmag', mag.value[0], mag.value[1]],
+    ['st_j', Jmag.value[0], Jmag.value[1]],
+];
+const n = d['pl_name'].length;
+const indices = [];
+for (let i = 0; i < n; i++) {
+    let inside = true;
+    for (const [name, lo, hi] of ranges) {
+        const v = d[name][i];
+        if (!(v >= lo && v <= hi)) {
+            inside = false;
+            break;
+        }
+    }
+    if (inside) {
+        indices.push(i);
+    }
+}
+selected_rows.indices = indices;
+view.compute_indices();
+"""
+
+#Points the glyphs at the columns of the chosen axes (in the chosen units), and updates labels, formatters and tooltips.
+AXES_JS = """
+const unit = units.labels[units.active];
+const column = (name) => (name in unit_columns[unit]) ? unit_columns[unit][name] : name;
+const label = (axis) => axis + ' ' + ((axis in unit_labels[unit]) ? unit_labels[unit][axis] : unit_map[axis]);
+const x_name = axis_map[x_axis.value];
+const y_name = axis_map[y_axis.value];
+for (const r of renderers) {
+    r.glyph.x = {field: column(x_name)};
+    r.glyph.y = {field: column(y_name)};
+}
+for (const a of xaxes) {
+    a.axis_label = label(x_axis.value);
+}
+for (const a of yaxes) {
+    a.axis_label = label(y_axis.value);
+}
+for (const a of log_xaxes) {
+    a.formatter = superscript_names.includes(x_name) ? superscript_formatter : plain_formatter;
+}
+for (const a of log_yaxes) {
+    a.formatter = superscript_names.includes(y_name) ? superscript_formatter : plain_formatter;
+}
+for (const h of hovers) {
+    h.tooltips = tooltips[unit];
+}
+"""
+
+#Shows the one figure that has the chosen combination of log and linear axes, like change_logscale().
+LOGSCALE_JS = """
+const xlog = axis_log.active.includes(0);
+const ylog = axis_log.active.includes(1);
+figures[0].visible = !xlog && !ylog;
+figures[1].visible = xlog && !ylog;
+figures[2].visible = !xlog && ylog;
+figures[3].visible = xlog && ylog;
+"""
+
+
+def link(selection_sliders, ticks, view, selected_rows, axes_widgets, units, axis_log, figures, renderers, maps, formatters):
+    """This attaches the JavaScript callbacks to the widgets.
+
+    selection_sliders are the eight sliders [mass,rad,per,ecc,teq,teff,mag,Jmag], ticks the mass and radius tick values
+    in Jupiter units, axes_widgets the x and y Select widgets, figures the four figures (lin-lin, log-lin,
+    lin-log, log-log), maps the dicts (axis_map, unit_map, unit_columns, unit_labels) and formatters the
+    superscript and plain tick formatters with the list of axis columns that use the superscripts."""
+    mass, rad, per, ecc, teq, teff, mag, Jmag = selection_sliders
+    x_axis, y_axis = axes_widgets
+    axis_map, unit_map, unit_columns, unit_labels = maps
+    superscript_formatter, plain_formatter, superscript_names = formatters
+    source = view.source
+
+    filter_callback = CustomJS(args=dict(source=source, view=view, selected_rows=selected_rows,
+                                         mass_ticks=ticks[0].tolist(), radius_ticks=ticks[1].tolist(),
+                                         mass=mass, rad=rad, per=per, ecc=ecc, teq=teq, teff=teff, mag=mag, Jmag=Jmag), code=FILTER_JS)
+    for slider in selection_sliders:
+        slider.js_on_change('value', filter_callback)
+    for event in ['change:data', 'patching', 'streaming']:#The server sent new planets (see sync.py).
+        source.js_on_change(event, filter_callback)
+
+    axes_callback = CustomJS(args=dict(units=units, x_axis=x_axis, y_axis=y_axis, renderers=renderers,
+                                       xaxes=[p.xaxis[0] for p in figures], yaxes=[p.yaxis[0] for p in figures],
+                                       log_xaxes=[figures[1].xaxis[0], figures[3].xaxis[0]], log_yaxes=[figures[2].yaxis[0], figures[3].yaxis[0]],
+                                       hovers=[p.hover[0] for p in figures], tooltips=TOOLTIPS,
+                                       axis_map=axis_map, unit_map=unit_map, unit_columns=unit_columns, unit_labels=unit_labels,
+                                       superscript_formatter=superscript_formatter, plain_formatter=plain_formatter,
+                                       superscript_names=list(superscript_names)), code=AXES_JS)
+    for widget in axes_widgets:
+        widget.js_on_change('value', axes_callback)
+    units.js_on_change('active', axes_callback)
+
+    axis_log.js_on_change('active', CustomJS(args=dict(axis_log=axis_log, figures=figures), code=LOGSCALE_JS))
@@ -0,0 +1,87 @@
+# The density mode of the Bokeh app (settings.AGGREGATE), for populations that are too large to draw planet by planet.
+#
+# Instead of one circle per planet, the plotted window is divided into a grid of settings.GRID_SIZE x settings.GRID_SIZE
+# cells, and only the cells that contain planets are sent to the browser, each with the number of planets in it. On a
+# log axis the cells are equally wide in log space, so that they look equally wide on the screen.
+#
+# The grid cell of every planet is computed once per choice of axes and window (see cell_numbers()). Counting the
+# planets per cell is then a single bincount, both for all planets and for the selected ones, so that moving a
+# selection slider doesn't bin the population again.
+
+import numpy as np
+
+
+def extent(values, log):
+    """Returns the smallest and largest value of values that can be plotted (finite, and larger than zero on a log axis),
+    or None if there are none."""
+    values = np.asarray(values, dtype=float)
+    ok = np.isfinite(values)
+    if log:
+        ok &= values > 0
+    if not ok.any():
+        return(None)
+    return(float(values[ok].min()), float(values[ok].max()))
+
+
+def in_window(x, y, window):
+    """Returns a boolean mask that is True for the planets inside window = (x0, x1, y0, y1)."""
+    x0, x1, y0, y1 = window
+    with np.errstate(invalid='ignore'):
+        return((x >= min(x0, x1)) & (x <= max(x0, x1)) & (y >= min(y0, y1)) & (y <= max(y0, y1)))
+
+
+def bin_edges(lo, hi, n, log):
+    """Returns the n+1 edges of n cells between lo and hi, spaced logarithmically if log is True."""
+    if hi <= lo:#A single value. Give the cell some width, or it can't be drawn.
+        lo, hi = (lo/2, hi*2) if log else (lo-0.5, hi+0.5)
+    if log:
+        return(np.logspace(np.log10(lo), np.log10(hi), n+1))
+    return(np.linspace(lo, hi, n+1))
+
+
+def _cell_index(values, edges, log):
+    """Returns for each value the number of the cell it falls in along one axis, or -1 if it's outside of all cells."""
+    n = len(edges)-1
+    values = np.asarray(values, dtype=float)
+    lo, hi = edges[0], edges[-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if log:
+            t = (np.log10(values)-np.log10(lo))/(np.log10(hi)-np.log10(lo))
+        else:
+            t = (values-lo)/(hi-lo)
+        i = np.floor(t*n)
+        i[t == 1.0] = n-1#The right edge belongs to the last cell.
+        i[~((i >= 0) & (i < n))] = -1#This includes the NaNs.
+    return(i.astype(np.int64))
+
+
+def cell_numbers(x, y, x_edges, y_edges, xlog, ylog):
+    """Returns for each planet the number of the grid cell it falls in (row-major, y first), or -1 if it's outside of the
+    grid or has no x or y value."""
+    ix = _cell_index(x, x_edges, xlog)
+    iy = _cell_index(y, y_edges, ylog)
+    cells = iy*(len(x_edges)-1)+ix
+    cells[(ix < 0) | (iy < 0)] = -1
+    return(cells)
+
+
+def bin_table(cells, x_edges, y_edges, rows=None):
+    """Counts the planets per cell. rows is a boolean mask of the planets to count (default all of them).
+    Returns the columns of the rectangles of the non-empty cells: their edges, the number of planets in them, and an
+    opacity that increases with the logarithm of that number."""
+    nx = len(x_edges)-1
+    ny = len(y_edges)-1
+    if rows is not None:
+        cells = cells[rows]
+    counts = np.bincount(cells[cells >= 0], minlength=nx*ny)
+    filled = np.flatnonzero(counts)
+    ix = filled % nx
+    iy = filled//nx
+    count = counts[filled]
+    alpha = 0.2+0.8*np.log1p(count)/np.log1p(max(count.max(), 1)) if len(count) else np.zeros(0)
+    return(dict(left=x_edges[ix], right=x_edges[ix+1], bottom=y_edges[iy], top=y_edges[iy+1], count=count, alpha=alpha))
+
+
+def empty_table():
+    """The columns of bin_table() without any cells."""
+    return(dict(left=[], right=[], bottom=[], top=[], count=[], alpha=[]))
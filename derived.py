@@ -0,0 +1,204 @@
+# Columns that are computed from other columns of the catalog, like the equilibrium temperature.
+#
+# Each derived column is declared below with the derived() decorator: its name, its unit, and the columns it is
+# computed from. The function gets those columns as arrays and returns the new column, for all planets at once.
+# Derived columns can depend on other derived columns.
+#
+# Nothing is computed until it is asked for. The catalog is a Catalog (a dict of column name -> array, like before),
+# and asking it for a derived column that it doesn't have yet computes that column, and keeps it. So adding a column
+# here costs nothing at start-up; it is only computed when e.g. an axis or a filter needs it. When a column is replaced,
+# the derived columns that depend on it are dropped, and computed again the next time they are asked for.
+#
+# A session of the app gets its own Catalog (see catalog.session_view()), which takes derived columns from the
+# shared catalog of the process, so that they are computed only once for all sessions. Unless the session has replaced
+# one of the columns they depend on: then the session computes its own.
+#
+# The value of a derived column for a planet may only depend on the other columns of that same planet: sync.py relies
+# on that to compute them only for the planets that were added or changed in the archive.
+
+import re
+import threading
+
+import numpy as np
+
+import metrics
+
+SOLRAD_PER_AU = 6.957e8 / 1.495978707e11#Nominal solar radius over the astronomical unit, both in metres.
+REARTH_PER_RSUN = 6.3781e6 / 6.957e8#Nominal Earth radius over the nominal solar radius.
+TEFF_SUN = 5772.0#K
+G_EARTH = 9.80665#m/s2
+
+DERIVED = {}#name -> (inputs, function)
+UNITS = {}#name -> unit, like catalog.COLUMNS
+_lock = threading.RLock()
+
+
+def derived(name, inputs, unit=None):
+    """Declares the decorated function as the way to compute the column name from the columns inputs."""
+    def register(function):
+        DERIVED[name] = (list(inputs), function)
+        UNITS[name] = unit
+        return(function)
+    return(register)
+
+
+def dependents(name):
+    """Returns the names of all derived columns that depend on the column name, directly or through others."""
+    found = set()
+    todo = [name]
+    while todo:
+        current = todo.pop()
+        for other, (inputs, function) in DERIVED.items():
+            if current in inputs and other not in found:
+                found.add(other)
+                todo.append(other)
+    return(found)
+
+
+def dependencies(name):
+    """Returns the names of all columns that the derived column name is computed from, directly or through others."""
+    found = set()
+    todo = [name]
+    while todo:
+        for other in DERIVED.get(todo.pop(), ([], None))[0]:
+            if other not in found:
+                found.add(other)
+                todo.append(other)
+    return(found)
+
+
+class Catalog(dict):
+    """A dict of column name -> array that computes the derived columns in DERIVED when they are first asked for.
+
+    parent is the catalog that this one is a view of (the shared catalog, for a session). Derived columns are then
+    taken from the parent, unless this view has replaced one of their inputs. With readonly, computed columns are made
+    read-only, like the other columns of the shared catalog."""
+
+    def __init__(self, columns=(), parent=None, readonly=False):
+        dict.__init__(self, columns)
+        self.parent = parent
+        self.readonly = readonly
+        self.own = set()#The columns that were replaced in this view.
+
+    def __missing__(self, name):
+        if name not in DERIVED:
+            raise KeyError(name)
+        with _lock:
+            if dict.__contains__(self, name):#Computed by another thread in the meantime.
+                return(dict.__getitem__(self, name))
+            if self.parent is not None and not (dependencies(name) & self.own):
+                value = self.parent[name]
+            else:
+                inputs, function = DERIVED[name]
+                with metrics.stage('derive '+name):
+                    value = np.ascontiguousarray(function(*[self[i] for i in inputs]), dtype=np.float64)
+                if self.readonly:
+                    value.setflags(write=False)
+            dict.__setitem__(self, name, value)
+        return(value)
+
+    def __setitem__(self, name, value):
+        dict.__setitem__(self, name, value)
+        if self.parent is not None:
+            self.own.add(name)
+        for other in dependents(name):#These were computed from the old values.
+            self.pop(other, None)
+
+    def __contains__(self, name):
+        return(dict.__contains__(self, name) or name in DERIVED)
+
+
+#Typical effective temperatures and radii of main-sequence stars, by spectral type, roughly after Pecaut & Mamajek (2013).
+#A spectral type is turned into a number: O0 = 0, B0 = 10, A0 = 20, ..., M9 = 69, and interpolated in this table.
+SPECTRAL_CLASSES = 'OBAFGKM'
+SPECTRAL_TABLE = np.array([
+    #type, Teff (K), R (Rsun)
+    [5, 42000, 13.4],
+    [10, 31500, 7.2],
+    [15, 15700, 3.0],
+    [20, 9700, 2.2],
+    [25, 8080, 1.7],
+    [30, 7220, 1.6],
+    [35, 6510, 1.4],
+    [40, 5920, 1.1],
+    [45, 5660, 0.95],
+    [50, 5280, 0.85],
+    [55, 4450, 0.7],
+    [60, 3850, 0.6],
+    [65, 3060, 0.2],
+    [69, 2400, 0.1],
+])
+_spectral_pattern = re.compile(r'^\s*([OBAFGKM])\s*(\d+(\.\d+)?)?\s*([IV]*)')
+
+
+def spectral_code(spstr):
+    """Turns spectral types like 'G2 V' or 'K1.5' into numbers (see SPECTRAL_TABLE). Returns them with a boolean array that
+    is True where the star is a dwarf (luminosity class V, or none given). Unknown types give NaN."""
+    names, inverse = np.unique(np.asarray(spstr, dtype=str), return_inverse=True)#There are only a few hundred different ones.
+    codes = np.full(len(names), np.nan)
+    dwarf = np.zeros(len(names), dtype=bool)
+    for i, s in enumerate(names):
+        m = _spectral_pattern.match(s)
+        if m:
+            codes[i] = 10*SPECTRAL_CLASSES.index(m.group(1)) + float(m.group(2) or 5)
+            dwarf[i] = m.group(4) in ['', 'V']
+    return(codes[inverse], dwarf[inverse])
+
+
+@derived('st_teff_imputed', ['st_teff', 'st_spstr'], unit='K')
+def st_teff_imputed(st_teff, st_spstr):
+    """The stellar effective temperature, or where it is missing, the typical one of the spectral type."""
+    code, dwarf = spectral_code(st_spstr)
+    typical = np.interp(code, SPECTRAL_TABLE[:, 0], SPECTRAL_TABLE[:, 1])#NaN stays NaN.
+    return(np.where(np.isnan(st_teff), typical, st_teff))
+
+
+@derived('st_rad_imputed', ['st_rad', 'st_spstr'], unit='solRad')
+def st_rad_imputed(st_rad, st_spstr):
+    """The stellar radius, or where it is missing, the typical one of the spectral type (for dwarfs only)."""
+    code, dwarf = spectral_code(st_spstr)
+    typical = np.where(dwarf, np.interp(code, SPECTRAL_TABLE[:, 0], SPECTRAL_TABLE[:, 2]), np.nan)
+    return(np.where(np.isnan(st_rad), typical, st_rad))
+
+
+@derived('teq', ['st_teff_imputed', 'st_rad_imputed', 'pl_orbsmax'], unit='K')
+def teq(st_teff, st_rad, pl_orbsmax):
+    """The equilibrium temperature, for zero albedo and full redistribution. Thanks Brett!"""
+    return(st_teff * np.sqrt(st_rad * SOLRAD_PER_AU / 2 / pl_orbsmax))
+
+
+@derived('insol', ['st_teff_imputed', 'st_rad_imputed', 'pl_orbsmax'], unit='earthFlux')
+def insol(st_teff, st_rad, pl_orbsmax):
+    """The flux that the planet receives, relative to what the Earth receives from the Sun."""
+    return(st_rad**2 * (st_teff/TEFF_SUN)**4 / pl_orbsmax**2)
+
+
+@derived('pl_grav', ['pl_masse', 'pl_rade'], unit='m / s2')
+def pl_grav(pl_masse, pl_rade):
+    """The surface gravity of the planet."""
+    return(G_EARTH * pl_masse / pl_rade**2)
+
+
+@derived('pl_dens_imputed', ['pl_dens', 'pl_masse', 'pl_rade'], unit='g / cm3')
+def pl_dens_imputed(pl_dens, pl_masse, pl_rade):
+    """The density of the planet, or where it is missing, the density computed from its mass and radius."""
+    return(np.where(np.isnan(pl_dens), 5.514 * pl_masse / pl_rade**3, pl_dens))
+
+
+@derived('tsm', ['pl_rade', 'pl_masse', 'st_rad_imputed', 'teq', 'st_j'])
+def tsm(pl_rade, pl_masse, st_rad, teq, st_j):
+    """The transmission spectroscopy metric of Kempton et al. (2018), with their scale factors per size of planet."""
+    scale = np.select([pl_rade < 1.5, pl_rade < 2.75, pl_rade < 4.0], [0.190, 1.26, 1.28], default=1.15)
+    return(scale * pl_rade**3 * teq / (pl_masse * st_rad**2) * 10**(-st_j/5))
+
+
+def _planck_7_5(temperature):
+    """The Planck function at 7.5 micron, up to a constant."""
+    return(1.0/np.expm1(6.626e-34*2.998e8/(7.5e-6*1.381e-23*temperature)))
+
+
+@derived('esm', ['pl_rade', 'st_rad_imputed', 'teq', 'st_teff_imputed', 'st_k'])
+def esm(pl_rade, st_rad, teq, st_teff, st_k):
+    """The emission spectroscopy metric of Kempton et al. (2018), with a dayside temperature of 1.10 Teq."""
+    with np.errstate(over='ignore'):
+        return(4.29e6 * _planck_7_5(1.10*teq) / _planck_7_5(st_teff) * (pl_rade*REARTH_PER_RSUN/st_rad)**2 * 10**(-st_k/5))
@@ -0,0 +1,34 @@
+# This saves the exoplanet population explorer as a single, standalone HTML file, that can be opened in any browser or
+# put on a web server as a static file. No Bokeh server is needed to use it: the app is built in client-side mode
+# (see client_side.py), so all filtering happens in the browser. BokehJS and the catalog are included in the file
+# itself, so it also works without network access.
+#
+# Usage: python export_html.py [output.html]
+
+import sys
+from os.path import abspath, dirname
+
+from bokeh.application import Application
+from bokeh.application.handlers import DirectoryHandler
+from bokeh.embed import file_html
+from bokeh.resources import INLINE
+
+import settings
+
+
+def export_html(filename='exoplanet_population.html'):
+    """This runs the app once, without a server, and writes the resulting page to filename."""
+    settings.CLIENT_SIDE = True#main.py reads this when it runs.
+    app = Application(DirectoryHandler(filename=dirname(abspath(__file__))))
+    doc = app.create_document()
+    for handler in app.handlers:
+        if handler.failed:
+            raise RuntimeError('Could not build the app:\n%s' % handler.error_detail)
+    html = file_html(doc, INLINE, title=doc.title)
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(html)
+    print('Saved the explorer to %s (%.1f MB).' % (filename, len(html.encode('utf-8'))/1e6))
+
+
+if __name__ == '__main__':
+    export_html(*sys.argv[1:2])
@@ -0,0 +1,93 @@
+# The marginal histograms of the Bokeh app (settings.MARGINALS): how the planets are distributed along the x and the y
+# axis, for all planets and for the selected ones, next to the scatter plot.
+#
+# The bin of every planet is computed once per column and per choice of log or linear bins (see assignment()), and kept
+# for the whole process, because it is the same for every session. A new histogram of all planets is then a single
+# bincount. The histogram of the selected planets isn't counted again when a slider moves: only the planets that entered
+# or left the selection since the last time are added or taken off (see Marginal.select()), and only the bins whose
+# count changed are sent to the browser, as a patch (see main.py).
+
+import threading
+
+import numpy as np
+
+import settings
+from density import _cell_index, bin_edges, extent
+
+_assignments = {}#(id of the column, log, n_bins) -> (column, bins, edges)
+_assignments_lock = threading.Lock()
+MAX_ASSIGNMENTS = 64#Columns of a catalog that was swapped out are dropped, oldest first, when there are more than this.
+
+
+def assignment(values, log, n_bins=settings.HIST_BINS):
+    """Returns the bin of every planet (-1 for planets that can't be plotted: NaN, or not above zero on a log axis), and
+    the edges of the n_bins bins, which are spaced logarithmically if log is True. These are computed once per column."""
+    key = (id(values), log, n_bins)
+    with _assignments_lock:
+        found = _assignments.get(key)
+    if found is not None and found[0] is values:#The id of a column that is gone can be reused by another one.
+        return(found[1], found[2])
+    column = np.asarray(values, dtype=float)
+    limits = extent(column, log)
+    if limits is None:#Nothing to plot. A single empty bin, so that the histogram is still drawn.
+        bins, edges = np.full(len(column), -1, dtype=np.int32), np.array([0.0, 1.0])
+    else:
+        edges = bin_edges(limits[0], limits[1], n_bins, log)
+        bins = _cell_index(column, edges, log).astype(np.int32)
+    with _assignments_lock:
+        _assignments[key] = (values, bins, edges)
+        while len(_assignments) > MAX_ASSIGNMENTS:
+            _assignments.pop(next(iter(_assignments)))
+    return(bins, edges)
+
+
+def empty_table():
+    """The columns of a histogram without any bins."""
+    return(dict(left=[], right=[], count=[], selected=[]))
+
+
+def _count(bins, n):
+    """The number of planets in each of n bins, leaving out those that are in none (-1)."""
+    return(np.bincount(bins[bins >= 0], minlength=n))
+
+
+class Marginal(object):
+    """The histogram of one axis of a session: the counts of all planets and of the selected ones per bin."""
+
+    def __init__(self):
+        self.bins = None
+        self.mask = None#The selection that the counts of the selected planets are for.
+
+    def rebuild(self, bins, edges, selected=None):
+        """Counts all planets and the selected ones (a mask, or None for none) in the bins given by assignment().
+        Returns the whole table for the browser."""
+        self.bins, self.edges = bins, edges
+        n = len(edges)-1
+        self.count = _count(bins, n)
+        if selected is None or len(selected) != len(bins):
+            selected = np.zeros(len(bins), dtype=bool)
+        self.mask = np.array(selected, dtype=bool)
+        self.selected = _count(bins[self.mask], n)
+        return(self.table())
+
+    def table(self):
+        return(dict(left=self.edges[:-1], right=self.edges[1:], count=self.count, selected=self.selected))
+
+    def select(self, selected):
+        """Updates the counts of the selected planets for the new selection (a mask), from the planets that entered or
+        left it. Returns the bins whose count changed."""
+        if self.bins is None or len(selected) != len(self.bins):#No histogram yet; rebuild() will count them.
+            self.mask = np.array(selected, dtype=bool)
+            return(np.zeros(0, dtype=int))
+        n = len(self.edges)-1
+        moved = np.flatnonzero(selected != self.mask)
+        if 2*len(moved) > len(self.bins):#Counting them all again is quicker.
+            counts = _count(self.bins[selected], n)
+        else:
+            entered = moved[selected[moved]]
+            left = moved[~selected[moved]]
+            counts = self.selected + _count(self.bins[entered], n) - _count(self.bins[left], n)
+        changed = np.flatnonzero(counts != self.selected)
+        self.selected = counts
+        self.mask = np.array(selected, dtype=bool)
+        return(changed)
@@ -0,0 +1,93 @@
+# Finding the planets under the mouse in the matplotlib plot of plot.py, without going through all of them.
+#
+# matplotlib's own hit test (Collection.contains()) checks every point of the scatter plot on every move of the mouse.
+# Instead, HoverIndex puts the points in a grid of square cells in screen coordinates (pixels), as wide as the distance
+# within which a point counts as hovered, and sorts them by cell. The points near the mouse are then all in the 3x3
+# cells around it, which are found with binary searches: the cost is log(n) plus the few points in those cells.
+# The grid only has to be made again after the plot was zoomed, panned or resized. That is noticed by comparing the
+# limits and the size of the axes with those that the grid was made for, so no events need to be connected for it.
+#
+# throttled() makes sure that a handler of mouse events doesn't run more often than the screen can keep up with.
+
+import time
+
+import numpy as np
+
+
+class HoverIndex(object):
+    """Finds the points (x, y) of the axes ax that are within radius pixels of a position on the screen."""
+
+    def __init__(self, ax, x, y, radius):
+        self.ax = ax
+        self.xy = np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+        self.radius = float(radius)
+        self.view = None#The limits and the size of the axes that the grid was made for.
+
+    def _rebuild(self):
+        """Sorts the points that are on screen by the cell of the grid that they are in."""
+        screen = self.ax.transData.transform(self.xy)
+        x0, y0, x1, y1 = self.ax.bbox.extents
+        r = self.radius
+        with np.errstate(invalid='ignore'):#NaN and points off screen are left out.
+            rows = np.flatnonzero((screen[:, 0] >= x0-r) & (screen[:, 0] <= x1+r) & (screen[:, 1] >= y0-r) & (screen[:, 1] <= y1+r))
+        self.origin = (x0-r, y0-r)
+        self.n_cells_y = int((y1-y0+2*r)/r)+1
+        keys = self._keys(screen[rows, 0], screen[rows, 1])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.rows = rows[order]
+        self.screen = screen[self.rows]
+
+    def _cells(self, sx, sy):
+        return(np.floor((sx-self.origin[0])/self.radius).astype(np.int64), np.floor((sy-self.origin[1])/self.radius).astype(np.int64))
+
+    def _keys(self, sx, sy):
+        cx, cy = self._cells(sx, sy)
+        return(cx*self.n_cells_y+cy)#Cells of the same column are next to each other.
+
+    def query(self, sx, sy):
+        """Returns the rows of the points within the radius of the screen position (sx, sy) in pixels, in increasing order."""
+        view = (self.ax.get_xlim(), self.ax.get_ylim(), tuple(self.ax.bbox.bounds))
+        if view != self.view:#Zoomed, panned or resized since the grid was made.
+            self._rebuild()
+            self.view = view
+        cx, cy = self._cells(np.array([sx]), np.array([sy]))
+        cx, cy = int(cx[0]), int(cy[0])
+        lo_y, hi_y = max(cy-1, 0), min(cy+1, self.n_cells_y-1)
+        if lo_y > hi_y:
+            return(np.zeros(0, dtype=int))
+        near = []
+        for column in (cx-1, cx, cx+1):#The three cells of each column are one stretch of the sorted keys.
+            i0 = np.searchsorted(self.keys, column*self.n_cells_y+lo_y, side='left')
+            i1 = np.searchsorted(self.keys, column*self.n_cells_y+hi_y, side='right')
+            near.append(np.arange(i0, i1))
+        near = np.concatenate(near)
+        d2 = (self.screen[near, 0]-sx)**2+(self.screen[near, 1]-sy)**2
+        return(np.sort(self.rows[near[d2 <= self.radius**2]]))
+
+
+def throttled(handler, canvas, interval=0.03):
+    """Returns a handler of events that passes them on to handler, at most once per interval seconds. An event that
+    arrives sooner is passed on when the interval is over, unless a newer one arrived by then: only the last position
+    of the mouse matters."""
+    state = {'last': 0.0, 'pending': None}
+    timer = canvas.new_timer(interval=int(interval*1000))
+    timer.single_shot = True
+
+    def flush():
+        event, state['pending'] = state['pending'], None
+        if event is not None:
+            state['last'] = time.perf_counter()
+            handler(event)
+    timer.add_callback(flush)
+
+    def on_event(event):
+        if time.perf_counter()-state['last'] >= interval:
+            state['pending'] = None#This one is newer.
+            state['last'] = time.perf_counter()
+            handler(event)
+        else:
+            if state['pending'] is None:
+                timer.start()
+            state['pending'] = event
+    return(on_event)
@@ -15,14 +15,23 @@
 
 
 import numpy as np
-import astropy.units as u
-from astroquery.nasa_exoplanet_archive import NasaExoplanetArchive
-import copy
-import sys
-import numpy as np
-from bokeh.io import curdoc, show, reset_output
+from catalog import session_view, select_rows, shared_catalog, STYLE
+import settings
+import client_side
+import transport
+import metrics
+from scheduler import Scheduler, shared_pool
+import density
+import histograms
+import tooltips
+import axis_maps
+import sync
+from ticks import mass_ticker, radius_ticker, unit_ticks
+from selection import shared_indexes, query_mask, value_range
+from bokeh.io import curdoc
 from bokeh.layouts import column, layout, row
-from bokeh.models import ColumnDataSource, Div, Select, Slider, TextInput,RangeSlider,RadioGroup,CheckboxGroup
+from bokeh.models import ColumnDataSource, Div, Select, RangeSlider,RadioGroup,CheckboxGroup,CDSView,IndexFilter,HoverTool
+from bokeh.events import RangesUpdate
 from bokeh.models.formatters import FuncTickFormatter
 from bokeh.models.callbacks import CustomJS
 from bokeh.plotting import figure
@@ -31,74 +40,81 @@ from datetime import date
 import math
 
 
-def prep_table():
-    """This is a wrapper for reading and augmenting the Exoplanet data table to be suitable for interaction with bokeh.
-    It computes the equilibrium temperature, converts masses and radii. Thanks Brett!"""
-
-#TO DO: SOME PLANETS FALL OUT BECAUSE THEY DONT HAVE A STELLAR EFFECTIVE TEMPERATURE AND/OR STELLAR RADIUS.
-#HOWEVER THESE CAN BE APPROXIMATED FROM THE SPECTRAL TYPE. FOR EACH MISSING VALUE, I NEED TO LOOK UP WHAT A STAR WITH
-#THAT SPECTRAL TYPE TYPICALLY HAS FOR VALUES OF R_S AND T_EFF, AND REPLACE THOSE.
-    table = NasaExoplanetArchive.get_confirmed_planets_table(all_columns=True)#This is an astropy table.
-    transiting = table[(table['pl_tranflag'].data).astype(bool)]#Select only the transiting ones, and put them in a new table.
-    # transiting['pl_rade']=transiting['pl_radj'].to('earthRad')
-
-    equilibrium_temperature = (transiting['st_teff'] * np.sqrt(transiting['st_rad'] / 2 / transiting['pl_orbsmax'])).decompose()#Compute T_eq.
-    g = transiting['gaia_gmag'].quantity#Short-hand for the Gaia magnitude.
-
-    transiting['teq'] = equilibrium_temperature
-
-    transiting['colour'] = 'gray'#These set the appearance of the entries in the plot.
-    transiting['selcolour'] = 'orange'
-    transiting['alpha'] = 0.5
-
-    transiting['planetradius'] = transiting['pl_radj']*1.0
-    transiting['planetmass'] = transiting['pl_massj']*1.0
-    return(transiting)
-
-
-
-
-
-DF = prep_table()
-print(DF.colnames)
-# sys.exit()
+DF = session_view()#This session's view of the catalog, which is built only once and shared by all sessions. See catalog.py.
+#The planet mass and radius that are plotted depend on the units chosen in this session. They are added to the view
+#as references to the Jupiter or Earth columns of the shared catalog (not copies), and swapped by change_units().
+DF['planetradius'] = DF['pl_radj']
+DF['planetmass'] = DF['pl_massj']
+INDEXES = shared_indexes()#The sorted filter columns, also shared by all sessions.
+slider_masks = {}#The mask of each selection slider in this session, see update_selection().
+sent = transport.new_stats()#How much this session has sent to the browser. See transport.py.
+scheduler = Scheduler(curdoc(), shared_pool())#Runs the heavy part of the callbacks of this session, see scheduler.py.
+#The density mode needs the server, and draws the selected planets from seltable when zoomed in (see refresh_density()).
+AGGREGATE = settings.AGGREGATE and not settings.CLIENT_SIDE
+INDEX_SELECTION = (settings.INDEX_SELECTION and not AGGREGATE) or settings.CLIENT_SIDE
+if settings.AGGREGATE and settings.CLIENT_SIDE:
+    print('WARNING: The density mode (EXOPOP_AGGREGATE) needs the server, so it is not used in client-side mode.')
+TOOLTIP_DETAILS = settings.TOOLTIP_DETAILS and not settings.CLIENT_SIDE
+if settings.TOOLTIP_DETAILS and settings.CLIENT_SIDE:
+    print('WARNING: In client-side mode the browser has all columns already, so the tooltips are not fetched (EXOPOP_TOOLTIP_DETAILS).')
+MARGINALS = settings.MARGINALS and not settings.CLIENT_SIDE
+if settings.MARGINALS and settings.CLIENT_SIDE:
+    print('WARNING: The histograms next to the plot (EXOPOP_MARGINALS) need the server, so they are not shown in client-side mode.')
 
 
 # Create Column Data Source that will be used by the plot.
 # We create 2 tables. One that contains *all* planets; one that contains only the selected planets.
-datatable = ColumnDataSource(data=dict(x=[],y=[],P=[],Rp=[], Mp=[], T_eff=[], Name=[], Year=[], T_eq=[], Gmag=[],Jmag=[],color=[],alpha=[],rho=[],ecc=[],FeH=[]))
-seltable = ColumnDataSource(data=dict(x=[],y=[],P=[],Rp=[], Mp=[], T_eff=[], Name=[], Year=[], T_eq=[], Gmag=[],Jmag=[],selcolor=[],alpha=[],rho=[],ecc=[],FeH=[]))
-
-axis_map = {
-    "Planet mass": "planetmass",
-    "Planet radius": "planetradius",
-    "Orbital period": "pl_orbper",
-    "Eccentricity":"pl_orbeccen",
-    "Equilibrium temperature": "teq",
-    "Stellar Effective Temperature": "st_teff",
-    "Density": "pl_dens",
-    "Gaia magnitude":"gaia_gmag",
-    "2MASS J magnitude":"st_j",
-    "Metallicity [Fe/H]":"st_metfe",
-    "Year of discovery": "pl_disc",
-}
-unit_map = {
-    "Planet mass": "(Mj)",
-    "Planet radius": "(Rj)",
-    "Orbital period": "(d)",
-    "Eccentricity":"",
-    "Equilibrium temperature": "(K)",
-    "Stellar Effective Temperature": "(K)",
-    "Density": '(g/cm3)',
-    "Gaia magnitude":"",
-    "2MASS J magnitude":"",
-    "Metallicity [Fe/H]":"(dex)",
-    "Year of discovery": "",
+# The colour and transparency are the same for all points, so they are set on the glyphs (see below) instead of being columns.
+# Both tables have the mass and radius in both unit systems (Mj, Me, Rj, Re), so that a change of units only needs to
+# resend x and y (see change_units()).
+datatable = ColumnDataSource(data=dict(x=[],y=[],P=[],Mj=[],Me=[],Rj=[],Re=[], T_eff=[], Name=[], Year=[], T_eq=[], Gmag=[],Jmag=[],rho=[],ecc=[],FeH=[]))
+seltable = ColumnDataSource(data=dict(x=[],y=[],P=[],Mj=[],Me=[],Rj=[],Re=[], T_eff=[], Name=[], Year=[], T_eq=[], Gmag=[],Jmag=[],rho=[],ecc=[],FeH=[]))
+# In index mode (settings.INDEX_SELECTION), seltable stays empty. The selected planets are then drawn from
+# datatable itself, through a view that only shows the rows listed in an IndexFilter. When a slider moves, only these
+# row numbers are sent to the browser, instead of a second copy of all the columns of the selected planets.
+selected_rows = IndexFilter(indices=[])
+selview = CDSView(source=datatable, filters=[selected_rows])
+#A view doesn't notice by itself that the indices of its filter have changed, so it is told to recompute them.
+selected_rows.js_on_change('indices', CustomJS(args=dict(view=selview), code="view.compute_indices()"))
+# In density mode (settings.AGGREGATE) there are two more tables: the grid cells with all planets and those with the
+# selected planets. Either these or datatable and seltable are filled, depending on how many planets are in view.
+bintable = ColumnDataSource(data=density.empty_table())
+selbintable = ColumnDataSource(data=density.empty_table())
+#The state of the density mode of this session: the zoomed window (None for everything), the grid cells of the planets
+#for the current axes and window, and the mask of the selected planets.
+density_state = {'window': None, 'grid': None, 'selected': None, 'full': False}
+#The rows of the catalog that are in seltable now, and after a sync (see apply_sync()), the rows that have changed.
+seltable_state = {'rows': None, 'changed': None}
+# With settings.TOOLTIP_DETAILS, datatable and seltable only have x, y and the row of each planet in the catalog. The
+# browser asks for the contents of the tooltips of the planets that are hovered by setting the rows in request, and gets
+# them in details (see tooltips.py and send_details()). details_sent marks the rows that the browser has already.
+details = ColumnDataSource(data=tooltips.empty_table())
+request = ColumnDataSource(data=dict(row=[]))
+details_sent = np.zeros(len(DF['pl_name']), dtype=bool)
+# With settings.MARGINALS, the histograms of the x and the y values of all planets and of the selected ones are in xhist
+# and yhist (see histograms.py). marginals keeps the counts of this session, so that a change of the selection only
+# patches the bins whose count of selected planets changed (see patch_marginals()).
+xhist = ColumnDataSource(data=histograms.empty_table())
+yhist = ColumnDataSource(data=histograms.empty_table())
+marginals = {'x': histograms.Marginal(), 'y': histograms.Marginal()}
+
+#The axes that can be chosen, and their units. unit_map is changed by change_units(), so this session gets a copy of it.
+axis_map = axis_maps.axis_map
+unit_map = dict(axis_maps.unit_map)
+unit_columns = axis_maps.unit_columns
+unit_labels = axis_maps.unit_labels
+
+
+
+#The tooltips in both unit systems. They are swapped when the units change (see decorate_figure()).
+TOOLTIPS={
+    "Jupiter":[("Name","@Name"),("Mass", "@Mj"),("Radius", "@Rj"),("P", "@P d"),("Gmag/Jmag", "@Gmag/@Jmag"),("Teq", "@T_eq K")],
+    "Earth":[("Name","@Name"),("Mass", "@Me"),("Radius", "@Re"),("P", "@P d"),("Gmag/Jmag", "@Gmag/@Jmag"),("Teq", "@T_eq K")],
 }
-
-
-
-TOOLTIPS=[("Name","@Name"),("Mass", "@Mp"),("Radius", "@Rp"),("P", "@P d"),("Gmag/Jmag", "@Gmag/@Jmag"),("Teq", "@T_eq K")]
+if settings.CLIENT_SIDE:#The browser gets the catalog columns under their own names, see client_side.py.
+    TOOLTIPS=client_side.TOOLTIPS
+if TOOLTIP_DETAILS:#The fields are looked up in details, see tooltips.py.
+    TOOLTIPS=tooltips.TOOLTIPS
 #Note that the format of the tooltip can be completely customised using HTML code; see: https://docs.bokeh.org/en/latest/docs/user_guide/tools.html
 #E.g.:
 # TOOLTIPS = """
@@ -126,86 +142,21 @@ TOOLTIPS=[("Name","@Name"),("Mass", "@Mp"),("Radius", "@Rp"),("P", "@P d"),("Gma
 
 
 #Determine slider limits
-lim_mass = (0,math.ceil(np.nanmax(DF['planetmass'])))
+#The lowest and highest values are the ends of the sorted columns of the selection sliders (see selection.py), so that
+#a new session doesn't have to go through the whole catalog for them.
+lim_mass = (0,math.ceil(value_range(INDEXES['pl_massj'])[1]))
 lim_year = (np.nanmin(DF["pl_disc"]),int(date.today().year))#Limit year between first discovery and now.
-lim_mag  = (math.floor(np.nanmin(DF["gaia_gmag"])),math.ceil(np.max(DF["gaia_gmag"])))
-lim_jmag = (math.floor(np.nanmin(DF["st_j"])),math.ceil(np.max(DF["st_j"])))
-# lim_teq  = (0,math.ceil(np.nanmax(DF['teq'].to('K').value)/1000.0)*1000.0)#Will need to deal with infinites here.
+lim_mag  = (math.floor(value_range(INDEXES["gaia_gmag"])[0]),math.ceil(value_range(INDEXES["gaia_gmag"])[1]))
+lim_jmag = (math.floor(value_range(INDEXES["st_j"])[0]),math.ceil(value_range(INDEXES["st_j"])[1]))
+# lim_teq  = (0,math.ceil(np.nanmax(DF['teq'])/1000.0)*1000.0)#Will need to deal with infinites here.
 lim_teq = (0,5000)
-lim_rad  = (0,math.ceil(np.nanmax(DF['planetradius'].to('jupiterRad').value)))
-lim_teff = (0,math.ceil(np.nanmax(DF['st_teff'].to('K').value)/1000.0)*1000.0)
-lim_per  = (0,math.ceil(np.nanmax(DF['pl_orbper'].to('d').value)/1000.0)*1000.0)
+lim_rad  = (0,math.ceil(value_range(INDEXES['pl_radj'])[1]))
+lim_teff = (0,math.ceil(value_range(INDEXES['st_teff'])[1]/1000.0)*1000.0)
+lim_per  = (0,math.ceil(value_range(INDEXES['pl_orbper'])[1]/1000.0)*1000.0)
 lim_ecc = (0,1)
 
 
 
-#Here comes something tricky. Masses and radii are quantities that vary relevantly over orders of magnitude, from 0 to 30Mj. There are 'special' values
-#like 1Mj, 1Re, 1.6Re, etc. These are hard to capture in a functional form with some logarithm.
-#So I hardcoded them into string arrays; in the form of a JScript function that is passed to FuncTickFormatter that is passed to the format keyword that is passed to the RangeSlider.
-#...
-#The slider is now sliding through list-indices (step = 1, min=0, max=len(list)).
-#See the RangeSlider definitions below.
-#Now, why is it a problem that this is hardcoded?
-#Because there are variables that depend on the values in this list, for example the start and end of the rangeslider (i.e. the start and end index of this list, 0 and len(list)).
-#But more importantly, these values need to be queried later when the output values of the sliders are used.
-#This means that a python version of this ticker definition needs to exist, with numbers in it, with a unit of mass or kg, such that the planet database can be queried.
-#The easy way to do this is to simply copy-paste the below array var v=[...] arrays and make them python.
-#But that would be dangerous - hardcoding something like this is already bad enough.
-mass_ticker="""
-    var v=['0 Me','1 Me','2 Me','5 Me','10 Me','20 Me (0.06 Mj)','0.1 Mj (32 Me)','0.2 Mj','0.5 Mj','0.8 Mj','1 Mj','1.5 Mj','2 Mj','3 Mj','5 Mj','8 Mj','10 Mj','13 Mj','20 Mj','30 Mj','50 Mj'];
-    return v[tick]
-    """
-radius_ticker="""
-    var v=['0 Re','0.5 Re','1 Re','1.6 Re','2 Re','3 Re (0.27 Rj)','4 Re (0.36 Rj)','5 Re (0.45 Rj)','0.5 Rj','0.8 Rj','1 Rj','1.2 Rj','1.5 Rj','1.8 Rj','2 Rj','2.5 Rj','3 Rj','5 Rj'];
-    return v[tick]
-    """
-#So why not write a python script that extracts and converts these?
-#Why not?
-#Here goes. First split out (on the line breaks) the line that contains the definition var v=, replace the
-mass_ticks=mass_ticker.split('\n')[1].replace('    var v=[','').replace('];','').replace("'",'').split(',')#This is a list of strings. Well done, Python.
-radius_ticks=radius_ticker.split('\n')[1].replace('    var v=[','').replace('];','').replace("'",'').split(',')#and the same for radius....
-mass_tick_values=[]
-radius_tick_values=[]
-for i in mass_ticks:
-    value=i.split(' ')[0]#The value is always the thing that is a number before the first space.
-    if i.split(' ')[1] == 'Me':
-        unit=u.earthMass
-    elif i.split(' ')[1] == 'Mj':
-        unit=u.jupiterMass
-    else:
-        print('ERROR: COULD NOT RESOLVE JScript string of mass ticks. Tried to resolve the following:')
-        print(i.split(' ')[1])
-    mass_tick_values.append(value*unit)
-for i in radius_ticks:
-    value=i.split(' ')[0]#The value is always the thing that is a number before the first space.
-    if i.split(' ')[1] == 'Re':
-        unit=u.earthRad
-    elif i.split(' ')[1] == 'Rj':
-        unit=u.jupiterRad
-    else:
-        print('ERROR: COULD NOT RESOLVE JScript string of radius ticks. Tried to resolve the following:')
-        print(i.split(' ')[1])
-    radius_tick_values.append(value*unit)
-#WHAM!
-#So.....
-#IF  YOU  EVER  WANT  TO  CHANGE  THE VALUES  OR  NUMBER  OF TICKS  IN  THE  MASS  OR  RADIUS  SLIDERS!
-#ONLY TOUCH THE JScript ARRAYS STARTING WITH var=[...], FILL THEM IN THERE WITH EITHER Me or Mj FOR EARTH OR JUPITER MASSES
-#AND Re OR Rj FOR EARTH OR JUPITER RADII. THE ABOVE RESOLVER WILL DO THE REST.
-#I love you, Python.
-#But do not touch the number of spaces before the var= thing or it will break. Do not touch any of that syntax, in fact.
-#I reproduce here how the variables should look in a working state, for safekeeping:
-#mass_ticker="""
-#    var v=['0 Me','1 Me','2 Me','5 Me','10 Me','20 Me (0.06 Mj)','0.1 Mj (32 Me)','0.2 Mj','0.5 Mj','0.8 Mj','1 Mj','1.5 Mj','2 Mj','3 Mj','5 Mj','8 Mj','10 Mj','13 Mj','20 Mj','30 Mj','50 Mj'];
-#    return v[tick]
-#    """
-#radius_ticker="""
-#    var v=['0 Re','0.5 Re','1 Re','1.6 Re','2 Re','3 Re (0.27 Rj)','4 Re (0.36 Rj)','5 Re (0.45 Rj)','0.5 Rj','0.8 Rj','1 Rj','1.2 Rj','1.5 Rj','1.8 Rj','2 Rj','2.5 Rj','3 Rj','5 Rj'];
-#    return v[tick]
-#    """
-
-
-
-
 # Create sliders and other controls
 # mass = RangeSlider(start=lim_mass[0], end=lim_mass[1], value=lim_mass,value_throttled=lim_mass, step=.1, title=list(axis_map.keys())[0])
 mass = RangeSlider(start=0, end=20, value=(0,20),value_throttled=(0,20), step=1, title=list(axis_map.keys())[0],format=FuncTickFormatter(code=mass_ticker))
@@ -229,117 +180,278 @@ y_axis = Select(title="Y Axis", options=sorted(axis_map.keys()), value=list(axis
 
 
 
-#Create 4 figures with different combinations of xlog and ylog.
-p1 = figure(plot_height=200, plot_width=200, title="", toolbar_location="right",toolbar_sticky=False,sizing_mode="scale_height",tooltips=TOOLTIPS,x_axis_type="linear",y_axis_type='linear',visible=False)
-p2 = figure(plot_height=200, plot_width=200, title="", toolbar_location="right",toolbar_sticky=False,sizing_mode="scale_height",tooltips=TOOLTIPS,x_axis_type="log",y_axis_type='linear',visible=False)
-p3 = figure(plot_height=200, plot_width=200, title="", toolbar_location="right",toolbar_sticky=False,sizing_mode="scale_height",tooltips=TOOLTIPS,x_axis_type="linear",y_axis_type='log',visible=False)
-p4 = figure(plot_height=200, plot_width=200, title="", toolbar_location="right",toolbar_sticky=False,sizing_mode="scale_height",tooltips=TOOLTIPS,x_axis_type="log",y_axis_type='log',visible=False)
-p1.circle(x="x", y="y", source=datatable, size=7, color="color", line_color=None, fill_alpha="alpha")
-p2.circle(x="x", y="y", source=datatable, size=7, color="color", line_color=None, fill_alpha="alpha")
-p3.circle(x="x", y="y", source=datatable, size=7, color="color", line_color=None, fill_alpha="alpha")
-p4.circle(x="x", y="y", source=datatable, size=7, color="color", line_color=None, fill_alpha="alpha")
-p1.circle(x="x", y="y", source=seltable, size=7, color="selcolor", line_color=None, fill_alpha="alpha")
-p2.circle(x="x", y="y", source=seltable, size=7, color="selcolor", line_color=None, fill_alpha="alpha")
-p3.circle(x="x", y="y", source=seltable, size=7, color="selcolor", line_color=None, fill_alpha="alpha")
-p4.circle(x="x", y="y", source=seltable, size=7, color="selcolor", line_color=None, fill_alpha="alpha")
-#All of them are set to invisible.
-
-
-
-
-def update():
-    """This updates the axis labels and circles after changing the axes or selection sliders."""
-    for p in [p1,p2,p3,p4]:
-        p.xaxis.axis_label = x_axis.value+' '+unit_map[x_axis.value]
-        p.yaxis.axis_label = y_axis.value+' '+unit_map[y_axis.value]
-    x_name = axis_map[x_axis.value]
-    y_name = axis_map[y_axis.value]
-    #This is where the actual conversion between the exoplanet input table and the dataframe read by Bokeh is done.
-    datatable.data = dict(x=DF[x_name],y=DF[y_name],P=DF["pl_orbper"],Mp=DF["planetmass"],Rp=DF["planetradius"],T_eq=np.round(DF["teq"],0),Gmag=np.round(DF["gaia_gmag"],1),Jmag=np.round(DF["st_j"],1),color=DF["colour"],alpha=DF["alpha"],Name=DF["pl_name"],rho=DF['pl_dens'],ecc=DF['pl_orbeccen'],FeH=DF["st_metfe"])#All this additional info is needed ONLY for the tooltip. Just sayin.
-
-    #This fixes the horribly looking superscripts native to Bokeh, kindly adopted from jdbocarsly on issue 6031; https://github.com/bokeh/bokeh/issues/6031
-    fix_substring_JS = """
-        var str = Math.log10(tick).toString(); //get exponent
-        var newStr = "";
-        for (var i=0; i<str.length;i++)
-        {
-            var code = str.charCodeAt(i);
-            switch(code) {
-                case 45: // "-"
-                    newStr += "⁻";
-                    break;
-                case 49: // "1"
-                    newStr +="¹";
-                    break;
-                case 50: // "2"
-                    newStr +="²";
-                    break;
-                case 51: // "3"
-                    newStr +="³"
-                    break;
-                default: // all digit superscripts except 1, 2, and 3 can be generated by adding 8256
-                    newStr += String.fromCharCode(code+8256)
-            }
+#This fixes the horribly looking superscripts native to Bokeh, kindly adopted from jdbocarsly on issue 6031; https://github.com/bokeh/bokeh/issues/6031
+fix_substring_JS = """
+    var str = Math.log10(tick).toString(); //get exponent
+    var newStr = "";
+    for (var i=0; i<str.length;i++)
+    {
+        var code = str.charCodeAt(i);
+        switch(code) {
+            case 45: // "-"
+                newStr += "⁻";
+                break;
+            case 49: // "1"
+                newStr +="¹";
+                break;
+            case 50: // "2"
+                newStr +="²";
+                break;
+            case 51: // "3"
+                newStr +="³"
+                break;
+            default: // all digit superscripts except 1, 2, and 3 can be generated by adding 8256
+                newStr += String.fromCharCode(code+8256)
         }
-        return 10+newStr;
-    """
-    normal_logstring_JS="return tick"
-    if x_name == 'planetmass' or x_name == 'planetradius' or x_name == 'pl_orbper':
-        p4.xaxis[0].formatter = FuncTickFormatter(code=fix_substring_JS)
-        p2.xaxis[0].formatter = FuncTickFormatter(code=fix_substring_JS)
-    else:
-        p4.xaxis[0].formatter = FuncTickFormatter(code=normal_logstring_JS)
-        p2.xaxis[0].formatter = FuncTickFormatter(code=normal_logstring_JS)
-    if y_name == 'planetmass' or y_name == 'planetradius' or y_name == 'pl_orbper':
-        p3.yaxis[0].formatter = FuncTickFormatter(code=fix_substring_JS)
-        p4.yaxis[0].formatter = FuncTickFormatter(code=fix_substring_JS)
+    }
+    return 10+newStr;
+"""
+normal_logstring_JS="return tick"
+#The tick formatters of the log axes. They are made only once, and shared by the axes that use them.
+superscript_formatter = FuncTickFormatter(code=fix_substring_JS)
+plain_formatter = FuncTickFormatter(code=normal_logstring_JS)
+superscript_names = ['planetmass', 'planetradius', 'pl_orbper']#The axes that get the superscripts.
+
+
+#Bokeh can't switch an axis between log and linear, so there is a figure for each combination of xlog and ylog.
+#But each figure is only made (and put on the page) when it is first asked for (see get_figure()), and only the one that
+#is shown is visible. Once on the page, a figure stays there: putting it back after taking it off would send all data
+#again, because Bokeh sends everything that a model refers to when it is added to the page.
+#In client-side mode, all four are made at once, because the browser has to be able to switch between them by itself.
+figures = {}#The figures made so far, by (xlog, ylog).
+marginal_figures = {}#With settings.MARGINALS, the histograms of the x and the y axis that go with each figure, and
+marginal_panels = {}#the column that holds them, right of the figure. See make_marginals().
+
+def make_figure(xlog, ylog):
+    """This creates a figure with log or linear axes, with one layer of circles for all planets, and one for the selected planets."""
+    p = figure(plot_height=200, plot_width=200, title="", toolbar_location="right",toolbar_sticky=False,sizing_mode="scale_height",tooltips=TOOLTIPS[units.labels[units.active]],x_axis_type="log" if xlog else "linear",y_axis_type="log" if ylog else "linear")
+    p.circle(x="x", y="y", source=datatable, size=7, color=STYLE["colour"], line_color=None, fill_alpha=STYLE["alpha"])
+    if INDEX_SELECTION:
+        p.circle(x="x", y="y", source=datatable, view=selview, size=7, color=STYLE["selcolour"], line_color=None, fill_alpha=STYLE["alpha"])
     else:
-        p3.yaxis[0].formatter = FuncTickFormatter(code=normal_logstring_JS)
-        p4.yaxis[0].formatter = FuncTickFormatter(code=normal_logstring_JS)
+        p.circle(x="x", y="y", source=seltable, size=7, color=STYLE["selcolour"], line_color=None, fill_alpha=STYLE["alpha"])
+    if AGGREGATE:
+        p.hover[0].renderers = list(p.renderers)#The tooltips of the planets don't apply to the grid cells.
+        cells = [p.quad(left="left", right="right", bottom="bottom", top="top", source=bintable, color=STYLE["colour"], line_color=None, fill_alpha="alpha"),
+                 p.quad(left="left", right="right", bottom="bottom", top="top", source=selbintable, color=STYLE["selcolour"], line_color=None, fill_alpha="alpha")]
+        p.add_tools(HoverTool(renderers=cells, tooltips=[("Planets", "@count")]))
+        p.on_event(RangesUpdate, lambda event: zoom(event))
+    if TOOLTIP_DETAILS:
+        tooltips.link(p.hover[0], details, request)
+    return(p)
+
+def make_marginals(p, xlog, ylog):
+    """This creates the histograms of the x and the y values that go next to the figure p, one above the other. They share
+    the range of the axis that they count along with p, so they follow it when it is zoomed. The histogram of the y
+    values lies on its side, with the bins along the y axis."""
+    hover = [("Planets", "@count"), ("Selected", "@selected")]
+    xh = figure(plot_height=100, plot_width=100, x_range=p.x_range, title="", toolbar_location=None, tools="", tooltips=hover, sizing_mode="scale_height", x_axis_type="log" if xlog else "linear")
+    xh.quad(left="left", right="right", bottom=0, top="count", source=xhist, color=STYLE["colour"], line_color=None, fill_alpha=STYLE["alpha"])
+    xh.quad(left="left", right="right", bottom=0, top="selected", source=xhist, color=STYLE["selcolour"], line_color=None, fill_alpha=STYLE["alpha"])
+    yh = figure(plot_height=100, plot_width=100, y_range=p.y_range, title="", toolbar_location=None, tools="", tooltips=hover, sizing_mode="scale_height", y_axis_type="log" if ylog else "linear")
+    yh.quad(left=0, right="count", bottom="left", top="right", source=yhist, color=STYLE["colour"], line_color=None, fill_alpha=STYLE["alpha"])
+    yh.quad(left=0, right="selected", bottom="left", top="right", source=yhist, color=STYLE["selcolour"], line_color=None, fill_alpha=STYLE["alpha"])
+    return(xh, yh)
+
+def get_figure(xlog, ylog):
+    """Returns the figure with the given combination of log and linear axes. It is made (and given the current axis labels)
+    if it doesn't exist yet."""
+    if (xlog, ylog) not in figures:
+        figures[(xlog, ylog)] = make_figure(xlog, ylog)
+        if MARGINALS:
+            marginal_figures[(xlog, ylog)] = make_marginals(figures[(xlog, ylog)], xlog, ylog)
+            marginal_panels[(xlog, ylog)] = column(*marginal_figures[(xlog, ylog)], sizing_mode="scale_height")
+        decorate_figure(figures[(xlog, ylog)], xlog, ylog)
+    return(figures[(xlog, ylog)])
+
+def decorate_figure(p, xlog, ylog):
+    """This sets the axis labels and tooltips of a figure for the current choice of axes and units, and gives its log
+    axes superscript tick labels if they show mass, radius or period. The tick formatters are shared, not made anew."""
+    x_name = axis_map[x_axis.value]
+    y_name = axis_map[y_axis.value]
+    unit = units.labels[units.active]
+    p.hover[0].tooltips = TOOLTIPS[unit]
+    p.xaxis.axis_label = x_axis.value+' '+unit_map[x_axis.value]
+    p.yaxis.axis_label = y_axis.value+' '+unit_map[y_axis.value]
+    if xlog:
+        p.xaxis[0].formatter = superscript_formatter if x_name in superscript_names else plain_formatter
+    if ylog:
+        p.yaxis[0].formatter = superscript_formatter if y_name in superscript_names else plain_formatter
+    if settings.CLIENT_SIDE:
+        #The browser already has all columns (see client_side.py), so the glyphs only need to be pointed at the right ones.
+        for r in p.renderers:
+            r.glyph.x = unit_columns[unit].get(x_name, x_name)
+            r.glyph.y = unit_columns[unit].get(y_name, y_name)
+    if (xlog, ylog) in marginal_figures:#The histograms count along the same axes.
+        xh, yh = marginal_figures[(xlog, ylog)]
+        xh.xaxis.axis_label = p.xaxis.axis_label
+        yh.yaxis.axis_label = p.yaxis.axis_label
+        xh.xaxis[0].formatter = p.xaxis[0].formatter
+        yh.yaxis[0].formatter = p.yaxis[0].formatter
+
+
+
+
+#The columns of the catalog that table_columns() needs besides x and y.
+TABLE_COLUMNS = ['pl_name'] if TOOLTIP_DETAILS else ['pl_name', 'pl_orbper', 'pl_massj', 'pl_masse', 'pl_radj', 'pl_rade',
+                                                     'teq', 'gaia_gmag', 'st_j', 'pl_dens', 'pl_orbeccen', 'st_metfe']
+
+def job_columns(*names):
+    """Returns the columns of DF with the given names, for a job of the scheduler. The jobs run in other threads, so they
+    get these arrays instead of DF itself: the session replaces columns of DF (see change_units() and apply_sync()), and
+    DF gets a derived column added the first time it is asked for (see derived.py)."""
+    return({name: DF[name] for name in names})
+
+def table_columns(D, x_name, y_name, rows=None):
+    """This is where the actual conversion between the exoplanet input table and the dataframe read by Bokeh is done.
+    Returns the columns of datatable (or seltable) for the rows of the catalog D (a mask or row numbers, or all if None),
+    with x_name and y_name on the axes. With settings.TOOLTIP_DETAILS, these are only x, y and the rows. D only needs
+    those columns and TABLE_COLUMNS."""
+    if TOOLTIP_DETAILS:
+        rows = np.arange(len(D['pl_name'])) if rows is None else np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return(dict(x=D[x_name][rows],y=D[y_name][rows],row=rows))
+    if rows is not None:
+        D = select_rows(D, rows)
+    return(dict(x=D[x_name],y=D[y_name],P=D["pl_orbper"],Mj=D["pl_massj"],Me=D["pl_masse"],Rj=D["pl_radj"],Re=D["pl_rade"],T_eq=np.round(D["teq"],0),Gmag=np.round(D["gaia_gmag"],1),Jmag=np.round(D["st_j"],1),Name=D["pl_name"],rho=D['pl_dens'],ecc=D['pl_orbeccen'],FeH=D["st_metfe"]))#All this additional info is needed ONLY for the tooltip. Just sayin.
+
+@metrics.timed('send_table')
+def send_table():
+    """Sends all columns of datatable to the browser. This is only needed once, after that only x and y change."""
+    #The columns are sent as compact typed arrays, see transport.py.
+    transport.send(datatable, table_columns(DF, axis_map[x_axis.value], axis_map[y_axis.value]), sent, 'datatable')
+
+@metrics.timed('send_details')
+def send_details(rows):
+    """Sends the contents of the tooltips of the planets in rows that the browser doesn't have yet, after it asked for
+    them by hovering (see tooltips.py). They are added to the end of details."""
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    rows = rows[(rows >= 0) & (rows < len(details_sent))]#Only what the browser could have been shown.
+    rows = rows[~details_sent[rows]]
+    if not len(rows):
+        return
+    details_sent[rows] = True
+    transport.stream(details, tooltips.detail_columns(DF, rows), sent, 'details')
+
+def forget_details():
+    """Empties details, after the catalog has changed (see apply_sync()). The browser then asks again."""
+    global details_sent
+    details_sent = np.zeros(len(DF['pl_name']), dtype=bool)
+    transport.send(details, tooltips.empty_table(), sent, 'details')
+
+#The callbacks below don't do the heavy work themselves, but ask the scheduler of this session to do it, so that quick
+#successive changes are merged, and other sessions don't have to wait (see scheduler.py). A job of the scheduler has
+#three parts: prepare_...() reads the widgets, compute_...() does the work in a worker thread without touching the
+#document, and apply_...() sends the result to the browser.
+
+def send_xy():
+    """Sends only the x and y columns, after the axes or the units have changed."""
+    if AGGREGATE:#The grid has to be made again, for the whole population.
+        density_state['window'] = None
+        refresh_density()
+        return
+    scheduler.request('xy', prepare_xy, transport.pack, apply_xy)
+    if not INDEX_SELECTION:#seltable has its own copy of x and y.
+        update_selection()
+
+def prepare_xy():
+    return(dict(x=DF[axis_map[x_axis.value]],y=DF[axis_map[y_axis.value]]))
+
+def apply_xy(packed):
+    transport.send_columns(datatable, packed, sent, 'datatable')
+
+def send_marginals():
+    """Sends the histograms of the x and the y values again, after the axes, the units, the log scales or the catalog have
+    changed. An axis whose column and log scale are the same as before isn't sent again."""
+    if MARGINALS:
+        scheduler.request('marginals', prepare_marginals, compute_marginals, apply_marginals)
+
+def prepare_marginals():
+    return(dict(x=(DF[axis_map[x_axis.value]], 0 in axis_log.active), y=(DF[axis_map[y_axis.value]], 1 in axis_log.active)))
+
+@metrics.timed('send_marginals')
+def compute_marginals(prepared):
+    """Returns the bin of every planet along each axis. These are computed only once per column, see histograms.py."""
+    return({axis: histograms.assignment(values, log) for axis, (values, log) in prepared.items()})
+
+def apply_marginals(assigned):
+    for axis, source in [('x', xhist), ('y', yhist)]:
+        bins, edges = assigned[axis]
+        m = marginals[axis]
+        if bins is m.bins and edges is m.edges:
+            continue
+        #The selected planets are counted for the selection that the browser shows now.
+        transport.send(source, m.rebuild(bins, edges, m.mask), sent, axis+'hist')
+
+def patch_marginals(constraints):
+    """Updates the counts of the selected planets in the histograms from the planets that entered or left the selection,
+    and sends only the bins whose count changed."""
+    for axis, source in [('x', xhist), ('y', yhist)]:
+        changed = marginals[axis].select(constraints)
+        transport.patch(source, changed, {'selected': marginals[axis].selected[changed]}, sent, axis+'hist')
+
+@metrics.timed('update')
+def update():
+    """This updates the axis labels and circles after changing the axes."""
+    for (xlog, ylog), p in figures.items():
+        decorate_figure(p, xlog, ylog)
+    if settings.CLIENT_SIDE:
+        update_selection()
+        return
+    #The selection doesn't depend on the axes, so only x and y are sent again.
+    send_xy()
+    send_marginals()
     #Wow. And it all still runs smoothly.
-    update_selection()
 
+@metrics.timed('change_logscale')
 def change_logscale():
     """This determines the value of the x-log, y-log buttons, and
     changes the scale of the x and y axes accordingly.
 
     Well, not 'change', but rather make visible the plot with the correct
-    combination of xlog and ylog. A bit cumbersome but so be it."""
-    for p in [p1,p2,p3,p4]:
-        p.visible=False#Set all figures to invisible.
-    #And then make only one visible again:
-    # print(axis_log.active)
-    if len(axis_log.active) == 0:
-        # print('Making p1 active')
-        p1.visible=True
-    elif len(axis_log.active) ==2:
-        # print('Making p4 active')
-        p4.visible=True
-    elif 0 in axis_log.active:
-        # print('Making p2 active')
-        p2.visible=True
-    else:
-        # print('Making p3 active')
-        p3.visible=True
-
+    combination of xlog and ylog, putting it on the page first if it is new."""
+    xlog = 0 in axis_log.active
+    ylog = 1 in axis_log.active
+    p = get_figure(xlog, ylog)
+    if p not in plot_row.children:
+        #Left of the column with the axis options, with the histograms right of it. They are added in one go, because
+        #every change of the children sends the whole row again, with all the data that the figures refer to.
+        new = [p, marginal_panels[(xlog, ylog)]] if MARGINALS else [p]
+        plot_row.children = plot_row.children[:-1]+new+plot_row.children[-1:]
+    for (x, y), p in figures.items():
+        p.visible = (x, y) == (xlog, ylog)
+        if MARGINALS:
+            marginal_panels[(x, y)].visible = p.visible
+    send_marginals()#The bins are spaced differently on a log axis.
+    if AGGREGATE:#The cells are spaced differently on a log axis.
+        density_state['window'] = None
+        refresh_density()
+
+@metrics.timed('change_units')
 def change_units():
-    """This switches the units of radius and mass between Jupiter (default) and Earth via the radio button."""
-    if units.labels[units.active] == 'Jupiter':
-        DF['planetradius'] = DF['pl_radj']*1.0
-        DF['planetmass'] = DF['pl_massj']*1.0
-        unit_map["Planet mass"] = "(Mj)"
-        unit_map["Planet radius"] = "(Rj)"
-    elif units.labels[units.active] == 'Earth':
-        DF['planetradius'] = DF['pl_rade']*1.0
-        DF['planetmass'] = DF['pl_masse']*1.0
-        unit_map["Planet mass"] = "(Me)"
-        unit_map["Planet radius"] = "(Re)"
-    else:
+    """This switches the units of radius and mass between Jupiter (default) and Earth via the radio button.
+
+    Both units are already in the catalog and in the tables in the browser, so this only swaps which columns are
+    referenced. x and y are sent again if they show mass or radius; the selection doesn't depend on the units."""
+    unit = units.labels[units.active]
+    if unit not in unit_columns:
         print("ERROR: UNITS IS SET TO %s BUT THIS ISNT HANDLED."%units.labels[units.active])
-    update()
+        return
+    for name, column in unit_columns[unit].items():
+        DF[name] = DF[column]#A reference to the column of the shared catalog, not a copy.
+    unit_map.update(unit_labels[unit])
+    for (xlog, ylog), p in figures.items():
+        decorate_figure(p, xlog, ylog)
+    if axis_map[x_axis.value] in unit_columns[unit] or axis_map[y_axis.value] in unit_columns[unit]:
+        send_xy()
+        send_marginals()
 def update_selection():
-    x_name = axis_map[x_axis.value]
-    y_name = axis_map[y_axis.value]
+    """This asks for the selection to be made again, after a selection slider has moved."""
+    scheduler.request('selection', prepare_selection, compute_selection, apply_selection)
+
+def prepare_selection():
+    """Returns the ranges of the sliders, and the columns on the axes."""
     # mass = RangeSlider(start=lim_mass[0], end=lim_mass[1], value=lim_mass,value_throttled=lim_mass, step=.1, title=list(axis_map.keys())[0])
     # rad  = RangeSlider(start=lim_rad[0], end=lim_rad[1], value=lim_rad,value_throttled=lim_rad, step=.1, title=list(axis_map.keys())[1])
     # # per  = RangeSlider(start=lim_per[0], end=lim_per[1], value=lim_per, step=.1, title=list(axis_map.keys())[2])
@@ -349,48 +461,146 @@ def update_selection():
     # mag  = RangeSlider(start=lim_mag[0], end=lim_mag[1], value=lim_mag,value_throttled=lim_mag, step=.1, title=list(axis_map.keys())[5])
     # year = RangeSlider(start=lim_year[0], end=lim_year[1], value=lim_year,value_throttled=lim_year, step=1, title=list(axis_map.keys())[6])
 
-    #Ok some weird unit things here.
-    #DF["pl_massj"] gives the mass without astropy unit; so just floats, in jupiter masses.
-    #DF["pl_radj"] gives the radius with an astropy unit of jupiter radii.
-    #So for the mass I dont pick the value of the column, but for radius I do.
-    #Secondly, unit.to('jupiterMass') returns a FLOAT, not an astropy unit.
-    mass_min = mass_tick_values[mass.value_throttled[0]]
-    mass_max = mass_tick_values[mass.value_throttled[1]]
-    mass_constraints = (DF["pl_massj"] >= mass_min.to('jupiterMass')) & (DF["pl_massj"] <= mass_max.to('jupiterMass'))
-    radius_min = radius_tick_values[rad.value_throttled[0]]
-    radius_max = radius_tick_values[rad.value_throttled[1]]
-    radius_constraints = (DF["pl_radj"].value >= radius_min.to('jupiterRad')) & (DF["pl_radj"].value <= radius_max.to('jupiterRad'))
-    per_min = 10**per.value_throttled[0]
-    per_max = 10**per.value_throttled[1]
-    per_constraints = (DF[axis_map["Orbital period"]].value>=per_min) & (DF[axis_map["Orbital period"]].value<=per_max)
-    ecc_min = ecc.value_throttled[0]
-    ecc_max = ecc.value_throttled[1]
-    ecc_constraints = (DF[axis_map["Eccentricity"]]>=ecc_min) & (DF[axis_map["Eccentricity"]]<=ecc_max)
-    teq_min = teq.value_throttled[0]
-    teq_max = teq.value_throttled[1]
-    teq_constraints = (DF[axis_map["Equilibrium temperature"]].value>=teq_min) & (DF[axis_map["Equilibrium temperature"]].value<=teq_max)
-    teff_min = teff.value_throttled[0]
-    teff_max = teff.value_throttled[1]
-    teff_constraints = (DF[axis_map["Stellar Effective Temperature"]].value>=teff_min) & (DF[axis_map["Stellar Effective Temperature"]].value<=teff_max)
-    mag_min = mag.value_throttled[0]
-    mag_max = mag.value_throttled[1]
-    mag_constraints = (DF[axis_map["Gaia magnitude"]]>=mag_min) & (DF[axis_map["Gaia magnitude"]]<=mag_max)
-    Jmag_min = Jmag.value_throttled[0]
-    Jmag_max = Jmag.value_throttled[1]
-    Jmag_constraints = (DF["st_j"]>=Jmag_min) & (DF["st_j"]<=Jmag_max)
-    # year_min = year.value_throttled[0]
-    # year_max = year.value_throttled[1]
+    #The ranges of the sliders, in the units of the catalog (see catalog.COLUMNS): Jupiter masses and radii, days, K.
+    #The mass and radius sliders slide through the tick lists in ticks.py, and the period slider through log10(P).
+    mass_ticks_mj, radius_ticks_rj = unit_ticks["Jupiter"]
+    ranges = {
+        "pl_massj": (mass_ticks_mj[int(mass.value_throttled[0])], mass_ticks_mj[int(mass.value_throttled[1])]),
+        "pl_radj": (radius_ticks_rj[int(rad.value_throttled[0])], radius_ticks_rj[int(rad.value_throttled[1])]),
+        axis_map["Orbital period"]: (10**per.value_throttled[0], 10**per.value_throttled[1]),
+        axis_map["Eccentricity"]: (ecc.value_throttled[0], ecc.value_throttled[1]),
+        axis_map["Equilibrium temperature"]: (teq.value_throttled[0], teq.value_throttled[1]),
+        axis_map["Stellar Effective Temperature"]: (teff.value_throttled[0], teff.value_throttled[1]),
+        axis_map["Gaia magnitude"]: (mag.value_throttled[0], mag.value_throttled[1]),
+        "st_j": (Jmag.value_throttled[0], Jmag.value_throttled[1]),
+    }
     # year_constraints = (DF[axis_map["Year of discovery"]]>=year_min) & (DF[axis_map["Year of discovery"]]<=year_max)
-
-
-
-    DFS=DF[mass_constraints & radius_constraints & per_constraints & teq_constraints & teff_constraints & mag_constraints & ecc_constraints & Jmag_constraints]
-    seltable.data = dict(x=DFS[x_name],y=DFS[y_name],P=DFS["pl_orbper"],Mp=DFS["planetmass"],Rp=DFS["planetradius"],T_eq=np.round(DFS["teq"],0),Gmag=np.round(DFS["gaia_gmag"],1),Jmag=np.round(DFS["st_j"],1),selcolor=DFS["selcolour"],alpha=DFS["alpha"],Name=DFS["pl_name"],rho=DFS['pl_dens'],ecc=DFS['pl_orbeccen'],FeH=DFS["st_metfe"])#All this additional info is needed ONLY for the tooltip. Just sayin.
+    x_name, y_name = axis_map[x_axis.value], axis_map[y_axis.value]
+    names = list(ranges)+['pl_name'] if INDEX_SELECTION or AGGREGATE else list(ranges)+[x_name, y_name]+TABLE_COLUMNS
+    return(ranges, x_name, y_name, job_columns(*names), INDEXES, slider_masks)
+
+@metrics.timed('update_selection')
+def compute_selection(prepared):
+    """Returns the mask of the selected planets, and in seltable mode also the columns of seltable."""
+    ranges, x_name, y_name, columns, indexes, cache = prepared
+    #The planets within each range are found by binary search in the sorted column (see selection.py), and the resulting
+    #mask is kept until that slider moves again. Planets without a value (NaN) are in none of the ranges.
+    with metrics.stage('update_selection.masks'):
+        constraints = query_mask(ranges, columns, indexes, cache=cache)
+    if INDEX_SELECTION or AGGREGATE:
+        return(constraints, None)
+    return(constraints, transport.pack(table_columns(columns, x_name, y_name, constraints)))
+
+def apply_selection(computed):
+    constraints, columns = computed
+    if metrics.ENABLED:
+        metrics.gauge('rows_selected', int(np.count_nonzero(constraints)))
+    if MARGINALS:
+        patch_marginals(constraints)
+    if INDEX_SELECTION:
+        transport.send_indices(selected_rows, np.flatnonzero(constraints), sent, 'selected_rows')
+        return
+    if AGGREGATE:
+        density_state['selected'] = constraints
+        refresh_density(selection_only=True)
+        return
+    rows = np.flatnonzero(constraints)
+    old, changed = seltable_state['rows'], seltable_state['changed']
+    seltable_state['rows'], seltable_state['changed'] = rows, None
+    if changed is not None and old is not None and len(rows) >= len(old) and np.array_equal(rows[:len(old)], old):
+        #After a sync, if the planets that were selected still are, only the changed and the new ones are sent.
+        n = len(old)
+        positions = np.flatnonzero(np.isin(old, changed))
+        transport.patch(seltable, positions, {name: values[positions] for name, values in columns.items()}, sent, 'seltable')
+        if len(rows) > n:
+            transport.stream(seltable, {name: values[n:] for name, values in columns.items()}, sent, 'seltable')
+        return
+    transport.send(seltable, columns, sent, 'seltable')
 
 
     # for i in radius_constraints:
     #     print(i)
 
+@metrics.timed('zoom')
+def zoom(event):
+    """In density mode, this makes the grid again for the window that was zoomed or panned to."""
+    density_state['window'] = (event.x0, event.x1, event.y0, event.y1)
+    refresh_density()
+
+def refresh_density(selection_only=False):
+    """This draws the planets in the current window in density mode: as grid cells if there are more than
+    settings.POINT_LIMIT of them, and as circles otherwise. The selected planets are drawn on top in the same way.
+    With selection_only, only the selection has changed, so the grid (or the circles of all planets) stays as it is."""
+    if not selection_only:
+        density_state['full'] = True#Stays set until the job runs, in case it is merged with a selection_only request.
+    scheduler.request('density', prepare_density, compute_density, apply_density)
+
+def prepare_density():
+    full = density_state['full']
+    density_state['full'] = False
+    if density_state['selected'] is None:#Nothing to draw before the first selection.
+        return(None)
+    x_name = axis_map[x_axis.value]
+    y_name = axis_map[y_axis.value]
+    return(dict(x=DF[x_name], y=DF[y_name], x_name=x_name, y_name=y_name, xlog=0 in axis_log.active, ylog=1 in axis_log.active,
+                window=density_state['window'], grid=density_state['grid'], selected=density_state['selected'], full=full,
+                columns=job_columns(x_name, y_name, *TABLE_COLUMNS)))
+
+@metrics.timed('refresh_density')
+def compute_density(p):
+    """Returns the grid (see below) and the tables to send."""
+    if p is None:
+        return(None)
+    x, y = p['x'], p['y']
+    window = p['window']
+    if window is None:#Everything that can be plotted on these axes.
+        x_extent = density.extent(x, p['xlog'])
+        y_extent = density.extent(y, p['ylog'])
+        if x_extent is None or y_extent is None:
+            window = (0, 0, 0, 0)
+        else:
+            window = x_extent+y_extent
+    #The grid holds the planets in the window, and the cell of each planet (or None if they're few enough to draw).
+    key = (p['x_name'], p['y_name'], p['xlog'], p['ylog'], window)
+    grid = p['grid']
+    full = p['full']
+    if grid is None or grid[0] != key:
+        full = True
+        visible = density.in_window(x, y, window)
+        n_visible = np.count_nonzero(visible)
+        if n_visible > settings.POINT_LIMIT:
+            x_edges = density.bin_edges(min(window[:2]), max(window[:2]), settings.GRID_SIZE, p['xlog'])
+            y_edges = density.bin_edges(min(window[2:]), max(window[2:]), settings.GRID_SIZE, p['ylog'])
+            grid = (key, visible, (density.cell_numbers(x, y, x_edges, y_edges, p['xlog'], p['ylog']), x_edges, y_edges))
+        else:
+            grid = (key, visible, None)
+    key, visible, cells = grid
+
+    tables = []
+    nothing = np.zeros(len(x), dtype=bool)
+    if cells is None:#Few enough planets in view to draw them one by one.
+        if full:
+            tables += [('datatable', table_columns(p['columns'], p['x_name'], p['y_name'], visible)),
+                       ('bintable', density.empty_table()), ('selbintable', density.empty_table())]
+        tables += [('seltable', table_columns(p['columns'], p['x_name'], p['y_name'], visible & p['selected']))]
+    else:
+        if full:
+            tables += [('bintable', density.bin_table(*cells)),
+                       ('datatable', table_columns(p['columns'], p['x_name'], p['y_name'], nothing)),
+                       ('seltable', table_columns(p['columns'], p['x_name'], p['y_name'], nothing))]
+        tables += [('selbintable', density.bin_table(*cells, rows=p['selected']))]
+    return(grid, [(name, transport.pack(columns)) for name, columns in tables])
+
+def apply_density(computed):
+    if computed is None:
+        return
+    density_state['grid'], tables = computed
+    sources = {'datatable': datatable, 'seltable': seltable, 'bintable': bintable, 'selbintable': selbintable}
+    for name, columns in tables:
+        if not len(next(iter(columns.values()))) and not len(next(iter(sources[name].data.values()), [])):
+            continue#Empty, and it was already.
+        transport.send(sources[name], columns, sent, name)
+
     # temp_constraints = (equilibrium_temperature < teq_max) & (equilibrium_temperature > teq_min)
     # rad_constraints = (rp < rad_max) & (rp > rad_min)
     # gmag_constaints = (g < gaia_mag_limit)
@@ -407,13 +617,31 @@ axes = [x_axis,y_axis]
 axis_options = [units,axis_log]
 
 
-for param in axes:#If the value of any of the sliders or the axes changes, we update.
-    param.on_change('value', lambda attr, old, new: update())
-for param in selection:
-    param.on_change('value_throttled', lambda attr, old, new: update_selection())
-
-axis_log.on_change('active', lambda attr, old, new: change_logscale())
-units.on_change('active', lambda attr, old, new: change_units())
+#The figure that is shown, or in client-side mode all four (lin-lin, log-lin, lin-log, log-log), see change_logscale().
+if settings.CLIENT_SIDE:
+    shown = [get_figure(False,False), get_figure(True,False), get_figure(False,True), get_figure(True,True)]
+else:
+    shown = [get_figure(0 in axis_log.active, 1 in axis_log.active)]
+    if MARGINALS:
+        shown += [marginal_panels[(0 in axis_log.active, 1 in axis_log.active)]]
+
+if settings.CLIENT_SIDE:#Everything happens in the browser. The server only sends the page, and the catalog with it.
+    #The browser compares these columns with the slider values itself, so they are sent in full precision (float64).
+    transport.send(datatable, client_side.column_set(DF), sent, 'datatable', dtypes={})
+    client_side.link(selection, unit_ticks["Jupiter"], selview, selected_rows, axes, units, axis_log,
+                     shown, [r for p in shown for r in p.renderers], (axis_map, unit_map, unit_columns, unit_labels),
+                     (superscript_formatter, plain_formatter, superscript_names))
+else:
+    for param in axes:#If the value of any of the sliders or the axes changes, we update.
+        param.on_change('value', lambda attr, old, new: update())
+    for param in selection:
+        param.on_change('value_throttled', lambda attr, old, new: update_selection())
+
+    axis_log.on_change('active', lambda attr, old, new: change_logscale())
+    units.on_change('active', lambda attr, old, new: change_units())
+    if TOOLTIP_DETAILS:
+        request.on_change('data', lambda attr, old, new: send_details(new['row']))
+        tooltips.forget(details)
 
 rightcol = axes+axis_options#left column.
 inputs1 = column(*selection, width=320, height=650)
@@ -424,11 +652,76 @@ inputs2.sizing_mode = "fixed"
 # inputs2.sizing_mode = "fixed"
 
 desc = Div(text=open(join(dirname(__file__), "description.html")).read(), sizing_mode="stretch_width")
-l = layout([[desc],[inputs1,p1,p2,p3,p4,inputs2],[Div(text='<i> by Jens Hoeijmakers (May 2020)</i>',sizing_mode="stretch_width")]], sizing_mode="scale_both")
+footer = [Div(text='<i> by Jens Hoeijmakers (May 2020)</i>',sizing_mode="stretch_width")]
+if settings.METRICS_PANEL:#A table of where the time goes, below the plot. See metrics.py.
+    diagnostics = Div(text='', sizing_mode="stretch_width")
+    footer = [diagnostics]+footer
+
+    def update_diagnostics():
+        """This fills the diagnostics panel with the traffic of this session and the timings and counts of this process."""
+        snap = metrics.snapshot()
+        rows = ''.join('<tr><td>%s</td><td>%i</td><td>%.1f</td><td>%.1f</td><td>%.1f</td></tr>' % (name, t['calls'], 1e3*t['total_s']/t['calls'], 1e3*t['max_s'], 1e3*t['last_s']) for name, t in sorted(snap['timings'].items()))
+        counts = ', '.join('%s: %s' % item for item in sorted(list(snap['counters'].items())+list(snap['gauges'].items())))
+        diagnostics.text = ('<b>This session:</b> %i updates, %.1f kB sent (last: %s)<br><b>This process:</b> %s'
+                            '<table><tr><th>stage</th><th>calls</th><th>mean (ms)</th><th>max (ms)</th><th>last (ms)</th></tr>%s</table>'
+                            % (sent['updates'], sent['bytes']/1e3, ', '.join('%s %.1f kB' % (k, v/1e3) for k, v in sent['last'].items()), counts, rows))
+    curdoc().add_periodic_callback(update_diagnostics, 2000)
+l = layout([[desc],[inputs1]+shown+[inputs2],footer], sizing_mode="scale_both")
+plot_row = l.children[1]#The figures are in the middle of this row. change_logscale() adds them.
+
+def apply_sync(shared, found):
+    """This brings the session up to date after a new shared catalog was swapped in (see sync.py). found is what
+    sync.changes() found between shared and the catalog before it: the rows that changed and the number of planets added
+    at the end. Only those are then sent, as patches and a stream. If the planets have moved (found is None), all tables
+    are sent again. So they are if yet another catalog was swapped in since shared, which found doesn't tell about."""
+    global DF, INDEXES, slider_masks
+    if DF.parent is shared:#The session started with it, or already caught up with a later swap.
+        return
+    current = shared_catalog()
+    if shared is not current:
+        shared, found = current, None
+    DF = session_view(shared)
+    for name, column in unit_columns[units.labels[units.active]].items():
+        DF[name] = DF[column]
+    INDEXES = shared_indexes()
+    slider_masks = {}#Not emptied: a job that is still running on the old catalog may put a mask in the old one.
+    scheduler.invalidate()#The jobs that are running now work on the old catalog. They run again.
+    if AGGREGATE:#The grid is made again, with the selection.
+        density_state['grid'] = None
+    elif found is None:
+        if settings.CLIENT_SIDE:
+            transport.send(datatable, client_side.column_set(DF), sent, 'datatable', dtypes={})
+        else:
+            send_table()
+        seltable_state['rows'] = None
+    else:
+        rows, added = found
+        new = np.arange(len(DF['pl_name'])-added, len(DF['pl_name']))
+        if settings.CLIENT_SIDE:#The same columns as the browser got at the start.
+            columns = [client_side.column_set(select_rows(DF, part)) for part in (rows, new)]
+            dtypes = {}
+        else:
+            columns = [table_columns(DF, axis_map[x_axis.value], axis_map[y_axis.value], part) for part in (rows, new)]
+            dtypes = transport.DTYPES
+        transport.patch(datatable, rows, columns[0], sent, 'datatable', dtypes)
+        if added:
+            transport.stream(datatable, columns[1], sent, 'datatable', dtypes)
+        seltable_state['changed'] = rows
+    if TOOLTIP_DETAILS:
+        forget_details()
+    send_marginals()#The columns are new, so the planets are assigned to the bins again.
+    if not settings.CLIENT_SIDE:#In client-side mode, the browser selects the planets again itself, see client_side.link().
+        update_selection()
+
+doc = curdoc()
+sync.watch(doc, apply_sync)#New planets from the archive are shown while the session is open.
+doc.on_session_destroyed(lambda session_context, doc=doc, unwatch=sync.unwatch: unwatch(doc))#Bound now: the globals of this module are gone by then.
 
 change_logscale()
-update()  # initial load of the data
+if not settings.CLIENT_SIDE and not AGGREGATE:
+    send_table()  # initial load of the data
 update_selection()
+scheduler.start()#From now on, the callbacks run in the background. Until now, everything ran right away, for the first page.
 curdoc().add_root(l)
 curdoc().title = "Exoplanet Population"
 
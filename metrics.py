@@ -0,0 +1,150 @@
+# Timings and counters of the app, to find out where the time goes when it is slow (settings.METRICS).
+#
+# The callbacks of main.py and the steps of loading the catalog are timed with the timed() decorator or the stage()
+# context, and the traffic and the number of sessions are counted with count(), gauge() and adjust(). Everything is kept per
+# server process, in memory, and can be read in three ways:
+# - snapshot() returns it as a dict; the diagnostics panel of the app (settings.METRICS_PANEL) shows it,
+# - every timing is also written as a line of JSON to the file settings.METRICS_LOG, if that is set,
+# - serve_http() answers http://localhost:<settings.METRICS_PORT>/metrics in the Prometheus text format.
+#
+# When settings.METRICS is off, timed() returns the function itself and stage() a context that does nothing, so that
+# the instrumentation costs (next to) nothing.
+
+import contextlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import settings
+
+ENABLED = settings.METRICS or settings.METRICS_PANEL or bool(settings.METRICS_PORT) or bool(settings.METRICS_LOG)
+
+_lock = threading.Lock()
+_timings = {}#name -> {'calls', 'total_s', 'max_s', 'last_s'}
+_counters = {}#name -> number, only ever increases.
+_gauges = {}#name -> number, the last value.
+_null = contextlib.nullcontext()
+
+log = logging.getLogger(__name__)
+if settings.METRICS_LOG:
+    _handler = logging.FileHandler(settings.METRICS_LOG)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+def _add_timing(name, seconds):
+    with _lock:
+        t = _timings.setdefault(name, {'calls': 0, 'total_s': 0.0, 'max_s': 0.0, 'last_s': 0.0})
+        t['calls'] += 1
+        t['total_s'] += seconds
+        t['max_s'] = max(t['max_s'], seconds)
+        t['last_s'] = seconds
+    if settings.METRICS_LOG:
+        log.info(json.dumps({'time': time.time(), 'stage': name, 'seconds': seconds}))
+
+
+@contextlib.contextmanager
+def _stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_timing(name, time.perf_counter()-t0)
+
+
+def stage(name):
+    """A context (with stage('masks'): ...) that times what happens inside it under name."""
+    if not ENABLED:
+        return(_null)
+    return(_stage(name))
+
+
+def timed(name):
+    """A decorator that times every call of a function under name. Without metrics, the function is left as it is."""
+    def decorate(function):
+        if not ENABLED:
+            return(function)
+        def wrapper(*args, **kwargs):
+            with _stage(name):
+                return(function(*args, **kwargs))
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return(wrapper)
+    return(decorate)
+
+
+def count(name, n=1):
+    """Adds n to the counter name (e.g. the bytes sent)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0)+n
+
+
+def gauge(name, value):
+    """Sets the gauge name to value (e.g. the number of selected planets)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[name] = value
+
+
+def adjust(name, delta):
+    """Adds delta to the gauge name (e.g. +1 or -1 for the number of sessions)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[name] = _gauges.get(name, 0)+delta
+
+
+def snapshot():
+    """Returns a copy of all timings, counters and gauges of this process."""
+    with _lock:
+        return({'timings': {k: dict(v) for k, v in _timings.items()}, 'counters': dict(_counters), 'gauges': dict(_gauges)})
+
+
+def prometheus_text():
+    """Returns snapshot() in the text format that Prometheus scrapes."""
+    snap = snapshot()
+    lines = []
+    for name, t in sorted(snap['timings'].items()):
+        lines.append('exopop_stage_calls_total{stage="%s"} %i' % (name, t['calls']))
+        lines.append('exopop_stage_seconds_total{stage="%s"} %.6f' % (name, t['total_s']))
+        lines.append('exopop_stage_seconds_max{stage="%s"} %.6f' % (name, t['max_s']))
+    for name, value in sorted(snap['counters'].items()):
+        lines.append('exopop_%s_total %s' % (name, value))
+    for name, value in sorted(snap['gauges'].items()):
+        lines.append('exopop_%s %s' % (name, value))
+    return('\n'.join(lines)+'\n')
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):#Scrapes are not worth a line in the server log.
+        pass
+
+
+def serve_http(port=settings.METRICS_PORT):
+    """Starts answering /metrics on localhost:port in a background thread. With several server processes, only the
+    first one gets the port; the others print a warning."""
+    try:
+        server = HTTPServer(('127.0.0.1', port), _MetricsHandler)
+    except OSError as e:
+        print('WARNING: Could not serve the metrics on port %s (%s).' % (port, e))
+        return(None)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return(server)
@@ -8,41 +8,30 @@ def plot_population():
     Jens Hoeijmakers, 04-05-2020"""
     import numpy as np
     import matplotlib.pyplot as plt
-    import astropy.units as u
-    from astroquery.nasa_exoplanet_archive import NasaExoplanetArchive
+    from astropy.table import Table
+    from catalog import select_rows, shared_catalog
+    from selection import query_tables
+    from hover import HoverIndex, throttled
 
 
     #First establish the rules that a planet must satisfy in order to be printed / highlighted.
-    teq_min = 1000 * u.K
-    teq_max = 1300 * u.K
-    rad_min = 2 * u.R_earth
-    rad_max = 4 * u.R_earth
-    gaia_mag_limit = 13
-    P_min = 0.0 * u.day
-    P_max = 1.0 * u.day
+    #The units are those of the catalog (see COLUMNS in catalog.py), and the limits are inclusive, like the sliders of the app.
+    #None means no limit. For many sets of rules at once, pass a list of these to query_tables() (see selection.py).
+    criteria = {
+        'teq': (1000, 1300),#K
+        'pl_rade': (2, 4),#Earth radii
+        'gaia_gmag': (None, 13),
+        'pl_orbper': (0.0, 1.0),#days
+    }
 
-    #Read the archive and compute the equilibrium temperature.
-    #TO DO: SOME PLANETS FALL OUT BECAUSE THEY DONT HAVE A STELLAR EFFECTIVE TEMPERATURE AND/OR STELLAR RADIUS.
-    #HOWEVER THESE CAN BE APPROXIMATED FROM THE SPECTRAL TYPE. FOR EACH MISSING VALUE, I NEED TO LOOK UP WHAT A STAR WITH
-    #THAT SPECTRAL TYPE TYPICALLY HAS FOR VALUES OF R_S AND T_EFF, AND REPLACE THOSE.
-    table = NasaExoplanetArchive.get_confirmed_planets_table(all_columns=True)#This is an astropy table.
-    transiting = table[(table['pl_tranflag'].data).astype(bool)]#Select only the transiting ones, and put them in a new table.
-    rp = transiting['pl_radj']#Short-hand for planet radii.
-    equilibrium_temperature = (transiting['st_teff'] * np.sqrt(transiting['st_rad'] / 2 / transiting['pl_orbsmax'])).decompose()#Compute T_eq.
-    g = transiting['gaia_gmag'].quantity#Short-hand for the Gaia magnitude.
-    P = transiting['pl_orbper']
-    transiting['teq'] = equilibrium_temperature
+    #Read the catalog of transiting planets. The equilibrium temperature is computed when it is first asked for.
+    transiting = shared_catalog()#This is a dict of plain numpy arrays, read from the local snapshot or from the archive (see catalog.py).
+    rp = transiting['pl_rade']#Short-hand for planet radii.
 
-    #Create boolean arrays for selecting the rows in the table, based on the above rules.
-    temp_constraints = (equilibrium_temperature < teq_max) & (equilibrium_temperature > teq_min)
-    rad_constraints = (rp < rad_max) & (rp > rad_min)
-    gmag_constaints = (g < gaia_mag_limit)
-    P_constraints = (P > P_min) & (P < P_max)
-    targets = transiting[temp_constraints & rad_constraints & gmag_constaints]#These are the highlighted planets.
-    targets = transiting[P_constraints]
-    targets.sort('gaia_gmag')
-    targets['r_earth'] = targets['pl_radj'].to(u.R_earth)
-    targets[['pl_name', 'gaia_gmag', 'teq', 'r_earth', 'pl_orbper','st_rad','st_teff','st_spstr']].pprint(max_lines=1000)
+    targets = query_tables(criteria)#These are the highlighted planets, brightest first.
+    targets['r_earth'] = targets['pl_rade']
+    printed = ['pl_name', 'gaia_gmag', 'teq', 'r_earth', 'pl_orbper','st_rad','st_teff','st_spstr']
+    Table([targets[name] for name in printed], names=printed).pprint(max_lines=1000)
 
 
 
@@ -50,14 +39,14 @@ def plot_population():
 
     #These are rules for the planets that will be plotted as gray background points.
     has_rp = (rp > 0.0)#There needs to be a radius
-    has_rs = (transiting['st_rad'] > 0)#...a stellar radius
-    has_teff = (transiting['st_teff'] > 0)#... a stellar T_eff
-    # is_spt = (transiting['st_spstr'].astype(str) == 'K2 V')#Test for being a particular spectral type. Will be needed to fill in systems with missing effective temperatures.
-    systems_to_plot = transiting[has_rp & has_rs & has_teff]#Only transiting planets here.
+    has_rs = (transiting['st_rad_imputed'] > 0)#...a stellar radius (from the spectral type if need be, see derived.py)
+    has_teff = (transiting['st_teff_imputed'] > 0)#... a stellar T_eff
+    # is_spt = (transiting['st_spstr'] == 'K2 V')#Test for being a particular spectral type. Will be needed to fill in systems with missing effective temperatures.
+    systems_to_plot = select_rows(transiting, has_rp & has_rs & has_teff)#Only transiting planets here.
 
     fig,ax = plt.subplots()
-    sc = plt.scatter(systems_to_plot['teq'],systems_to_plot['pl_radj'].to(u.R_earth),c='gray',s=20,alpha=0.5)
-    sct=plt.scatter(targets['teq'],targets['pl_radj'].to(u.R_earth),c='orange',s=20,alpha=0.5)
+    sc = plt.scatter(systems_to_plot['teq'],systems_to_plot['pl_rade'],c='gray',s=20,alpha=0.5)
+    sct=plt.scatter(targets['teq'],targets['pl_rade'],c='orange',s=20,alpha=0.5)
     ax.set_ylabel('Radius ($R_E$)')
     ax.set_xlabel('Equilibrium temperature (K)')
     ax.set_title('Temperature versus Radius')
@@ -70,13 +59,17 @@ def plot_population():
     names = systems_to_plot['pl_name']
     gmags = systems_to_plot['gaia_gmag']
     Ps = systems_to_plot['pl_orbper']
+    #The planets under the mouse are found in a grid on the screen instead of by sc.contains(), which goes through all of
+    #them (see hover.py). They count as hovered within the radius of the marker (s=20 is its area in points^2) plus the pick radius.
+    hover_index = HoverIndex(ax, systems_to_plot['teq'], systems_to_plot['pl_rade'], np.sqrt(20)/2*fig.dpi/72+sc.get_pickradius())
+    hovered = {'ind': ()}#The planets that the annotation is showing now.
     def update_annot_new(ind):
-        pos = sc.get_offsets()[ind["ind"][0]]
+        pos = sc.get_offsets()[ind[0]]
         annot.xy = pos
         text=''
-        n_in = len(ind["ind"])
+        n_in = len(ind)
         prefix=''#This becomes a newline if the forloop is run through more than once.
-        for n in ind["ind"]:
+        for n in ind:
             text+=prefix+names[n]+'\n'
             text+='     G = %s \n'%np.round(gmags[n],2)
             text+='     P = %s'%np.round(Ps[n],2)
@@ -85,17 +78,16 @@ def plot_population():
         annot.set_text(text)
         annot.get_bbox_patch().set_alpha(0.4)
     def newhover(event):
-        vis = annot.get_visible()
-        if event.inaxes == ax:
-            cont, ind = sc.contains(event)
-            if cont:
-                update_annot_new(ind)
-                annot.set_visible(True)
-                fig.canvas.draw_idle()
-            else:
-                if vis:
-                    annot.set_visible(False)
-                    fig.canvas.draw_idle()
-    fig.canvas.mpl_connect("motion_notify_event", newhover)
+        ind = tuple(hover_index.query(event.x, event.y)) if event.inaxes == ax else ()
+        if ind == hovered['ind']:#Still the same planets (or none), so there is nothing to draw.
+            return
+        hovered['ind'] = ind
+        if ind:
+            update_annot_new(ind)
+            annot.set_visible(True)
+        else:
+            annot.set_visible(False)
+        fig.canvas.draw_idle()
+    fig.canvas.mpl_connect("motion_notify_event", throttled(newhover, fig.canvas))#At most one hover every 30 ms.
     plt.show()
 plot_population()
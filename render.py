@@ -0,0 +1,239 @@
+# Renders many preset selections of planets to static plots (PNG, SVG) and standalone HTML pages, e.g. for reports.
+#
+# The presets are read from a JSON file like presets.json: every preset has a name and criteria (like those of
+# selection.py: a column of the catalog and the lowest and highest value, with null for no limit), and is plotted
+# against every pair of axes (the names of the axes of the app, see axis_maps.py) in every unit system that it lists.
+# axes, units, log and formats can be given for all presets at the top of the file, and for each preset on its own:
+#     {"axes": [["Equilibrium temperature", "Planet radius"]], "units": ["Jupiter", "Earth"], "log": [false, true],
+#      "formats": ["png", "svg", "html"],
+#      "presets": [{"name": "warm-sub-neptunes", "criteria": {"teq": [1000, 1300], "pl_rade": [2, 4]}}]}
+#
+# The catalog is loaded once, and the planets of all presets are selected in one batch query (see query_rows()). The
+# plots are then drawn by a pool of processes, with matplotlib's non-interactive Agg canvas for PNG and SVG, and with
+# Bokeh for HTML. The worker processes share the catalog of this one (or map the store, see store.py), so they don't
+# load it again.
+#
+# Every output file is listed in manifest.json in the output folder, with a key made from everything it was drawn from:
+# the preset, the axes, the units, the catalog (the time at which the snapshot was fetched) and RENDER_VERSION. Files
+# whose key hasn't changed since the last run are skipped, so after a change of the presets only the changed ones are
+# drawn again, and after an update of the catalog all of them. The time of each render is reported. Usage:
+#     python render.py presets.json [--output renders] [--workers 4] [--force]
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import exists, join
+
+import numpy as np
+
+from axis_maps import axis_column, axis_label, axis_map, unit_columns
+from catalog import STYLE, shared_catalog, snapshot_fetched
+from selection import query_rows
+
+RENDER_VERSION = 1#Change this when the plots are drawn differently, so that all of them are drawn again.
+MANIFEST_FILE = 'manifest.json'
+FORMATS = ['png', 'svg', 'html']
+#What a preset gets if neither it nor the top of the presets file says otherwise.
+DEFAULTS = {'axes': [['Equilibrium temperature', 'Planet radius']], 'units': ['Jupiter'], 'log': [False, False], 'formats': ['png']}
+
+
+def read_presets(filename):
+    """Returns the renders asked for in the presets file: one dict for every preset, pair of axes and unit system, with
+    the name of the preset, its criteria, the axes x and y, the unit, whether each axis is logarithmic, and the formats."""
+    with open(filename) as f:
+        config = json.load(f)
+    defaults = {name: config.get(name, value) for name, value in DEFAULTS.items()}
+    renders = []
+    for preset in config['presets']:
+        preset = dict(defaults, **preset)
+        criteria = {name: tuple(limits) for name, limits in preset['criteria'].items()}
+        for x, y in preset['axes']:
+            if x not in axis_map or y not in axis_map:
+                print('ERROR: Preset %s has an axis that the app does not have: %s, %s. Skipping it.' % (preset['name'], x, y))
+                continue
+            for unit in preset['units']:
+                if unit not in unit_columns:
+                    print('ERROR: Preset %s asks for units %s, which the app does not have. Skipping it.' % (preset['name'], unit))
+                    continue
+                formats = [f for f in preset['formats'] if f in FORMATS]
+                if len(formats) < len(preset['formats']):
+                    print('WARNING: Preset %s asks for formats other than %s. Those are skipped.' % (preset['name'], ', '.join(FORMATS)))
+                renders.append({'name': preset['name'], 'criteria': criteria, 'x': x, 'y': y, 'unit': unit,
+                                'log': [bool(l) for l in preset['log']], 'formats': formats})
+    return(renders)
+
+
+def base_name(render):
+    """The name of the output files of render, without the extension. The axes are named by their catalog columns, so
+    that the units are part of the name only if an axis shows mass or radius (otherwise both units give the same plot)."""
+    name = '%s__%s__%s' % (render['name'], axis_column(render['x'], render['unit']), axis_column(render['y'], render['unit']))
+    return(re.sub('[^A-Za-z0-9_.-]+', '_', name))
+
+
+def render_key(render, fmt, catalog_version):
+    """The key of an output file: it changes whenever anything that the file is drawn from changes."""
+    inputs = {'criteria': sorted(render['criteria'].items()), 'x': axis_column(render['x'], render['unit']),
+              'y': axis_column(render['y'], render['unit']), 'x_label': axis_label(render['x'], render['unit']),
+              'y_label': axis_label(render['y'], render['unit']), 'log': render['log'], 'format': fmt,
+              'catalog': catalog_version, 'style': STYLE, 'version': RENDER_VERSION}
+    return(hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest())
+
+
+def _start_worker():
+    import matplotlib
+    matplotlib.use('Agg')#Nothing is shown: the plots are only saved.
+    shared_catalog()#Inherited from the parent process, or mapped from the store.
+
+
+def _plottable(x, y, log):
+    """A mask of the planets that have a value on both axes (larger than zero on a logarithmic axis)."""
+    with np.errstate(invalid='ignore'):
+        ok = np.isfinite(x) & np.isfinite(y)
+        if log[0]:
+            ok &= x > 0
+        if log[1]:
+            ok &= y > 0
+    return(ok)
+
+
+def draw(render, rows, folder):
+    """Draws render, with the planets in rows (of the shared catalog) highlighted, in each of its formats. Returns the
+    time that each output file took, by file name."""
+    catalog = shared_catalog()
+    x = np.asarray(catalog[axis_column(render['x'], render['unit'])], dtype=float)
+    y = np.asarray(catalog[axis_column(render['y'], render['unit'])], dtype=float)
+    ok = _plottable(x, y, render['log'])
+    selected = np.zeros(len(x), dtype=bool)
+    selected[rows] = True
+    background, highlighted = np.flatnonzero(ok), np.flatnonzero(ok & selected)
+    title = '%s (%i planets)' % (render['name'], len(highlighted))
+    x_label, y_label = axis_label(render['x'], render['unit']), axis_label(render['y'], render['unit'])
+    timings = {}
+
+    figure = None
+    for fmt in render['formats']:
+        t0 = time.perf_counter()
+        filename = base_name(render)+'.'+fmt
+        if fmt == 'html':
+            _draw_html(catalog, x, y, background, highlighted, render['log'], title, x_label, y_label, join(folder, filename))
+        else:
+            if figure is None:#Drawn once for both PNG and SVG.
+                figure = _draw_figure(x, y, background, highlighted, render['log'], title, x_label, y_label)
+            figure.savefig(join(folder, filename), format=fmt)
+        timings[filename] = time.perf_counter()-t0
+    return(timings)
+
+
+def _draw_figure(x, y, background, highlighted, log, title, x_label, y_label):
+    """A matplotlib figure, on the Agg canvas and without pyplot, so that nothing is kept after it is saved."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(7, 5), dpi=100)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    ax.scatter(x[background], y[background], c=STYLE['colour'], s=20, alpha=STYLE['alpha'], linewidths=0)
+    ax.scatter(x[highlighted], y[highlighted], c=STYLE['selcolour'], s=20, alpha=STYLE['alpha'], linewidths=0)
+    ax.set_xscale('log' if log[0] else 'linear')
+    ax.set_yscale('log' if log[1] else 'linear')
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_title(title)
+    figure.tight_layout()
+    return(figure)
+
+
+def _draw_html(catalog, x, y, background, highlighted, log, title, x_label, y_label, filename):
+    """A standalone Bokeh page of the plot, with the names of the planets in the tooltips. BokehJS is loaded from the
+    internet (CDN), because hundreds of copies of it in one folder would take hundreds of MB."""
+    from bokeh.embed import file_html
+    from bokeh.models import ColumnDataSource
+    from bokeh.plotting import figure
+    from bokeh.resources import CDN
+    p = figure(width=700, height=500, title=title, x_axis_type='log' if log[0] else 'linear', y_axis_type='log' if log[1] else 'linear',
+               x_axis_label=x_label, y_axis_label=y_label, tooltips=[('Name', '@name'), (x_label, '@x'), (y_label, '@y')])
+    for rows, colour in [(background, STYLE['colour']), (highlighted, STYLE['selcolour'])]:
+        source = ColumnDataSource(data=dict(x=x[rows], y=y[rows], name=catalog['pl_name'][rows]))
+        p.circle(x='x', y='y', source=source, size=7, color=colour, line_color=None, fill_alpha=STYLE['alpha'])
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(file_html(p, CDN, title=title))
+
+
+def _read_manifest(folder):
+    try:
+        with open(join(folder, MANIFEST_FILE)) as f:
+            return(json.load(f))
+    except (OSError, ValueError):
+        return({})
+
+
+def _write_manifest(manifest, folder):
+    tmp = join(folder, MANIFEST_FILE+'.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, join(folder, MANIFEST_FILE))
+
+
+def render_presets(presets_file, folder='renders', workers=None, force=False):
+    """Draws the renders of presets_file (see read_presets()) that have changed since the last run into folder, in a pool
+    of workers processes (all cores by default). Returns the time of each output file that was drawn, by file name."""
+    os.makedirs(folder, exist_ok=True)
+    renders = read_presets(presets_file)
+    catalog = shared_catalog()
+    catalog_version = getattr(catalog, 'store_name', None) or snapshot_fetched()
+    manifest = _read_manifest(folder)
+
+    #Each render once (the same plot in both units is one render), with only the formats that have to be drawn again.
+    todo, keys, skipped = {}, {}, 0
+    for render in renders:
+        for fmt in render['formats']:
+            filename = base_name(render)+'.'+fmt
+            if filename in keys:#The same plot in the other units.
+                continue
+            keys[filename] = render_key(render, fmt, catalog_version)
+            if not force and manifest.get(filename, {}).get('key') == keys[filename] and exists(join(folder, filename)):
+                skipped += 1
+                continue
+            formats = todo.setdefault(base_name(render), dict(render, formats=[]))['formats']
+            if fmt not in formats:
+                formats.append(fmt)
+    todo = list(todo.values())
+
+    t0 = time.perf_counter()
+    timings = {}
+    if not todo:
+        print('All %i files are up to date.' % skipped)
+        return(timings)
+    found = query_rows([render['criteria'] for render in todo], sort_by=None)#All selections in one go, see selection.py.
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker) as pool:
+        futures = {pool.submit(draw, render, rows, folder): render for render, rows in zip(todo, found)}
+        for future in as_completed(futures):
+            try:
+                done = future.result()
+            except Exception as e:
+                print('ERROR: Could not draw %s: %r' % (base_name(futures[future]), e))
+                continue
+            for filename, seconds in done.items():
+                manifest[filename] = {'key': keys[filename], 'seconds': seconds}
+                timings[filename] = seconds
+    wall = time.perf_counter()-t0
+    _write_manifest(manifest, folder)
+
+    for filename, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        print('  %-70s %8.3f s' % (filename, seconds))
+    print('Drew %i files in %.2f s (%.2f s of drawing, %i workers). %i files were up to date.'
+          % (len(timings), wall, sum(timings.values()), workers or os.cpu_count(), skipped))
+    return(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render preset selections of planets to PNG, SVG and HTML files.')
+    parser.add_argument('presets', help='A JSON file with the presets, see the top of render.py.')
+    parser.add_argument('--output', default='renders', help='The folder to write the files to.')
+    parser.add_argument('--workers', type=int, help='The number of processes that draw (default: one per core).')
+    parser.add_argument('--force', action='store_true', help='Draw everything again, also what is up to date.')
+    args = parser.parse_args()
+    render_presets(args.presets, args.output, args.workers, args.force)
@@ -0,0 +1,112 @@
+# Runs the recomputations of a session of the Bokeh app without blocking the other sessions.
+#
+# The Bokeh server runs all sessions of a process on a single event loop. If a callback recomputes the selection
+# right there, every other session waits until it is done, and if a user moves three sliders in quick succession, the
+# selection is recomputed three times, even though only the last one matters.
+#
+# So the callbacks in main.py don't recompute anything themselves. They request a job from the Scheduler of their
+# session, by name. A job has three parts: prepare() reads the state of the widgets, on the event loop; compute() does
+# the heavy numpy work, in a pool of threads that is shared by all sessions (numpy lets go of the interpreter lock while
+# it works); and apply() puts the result in the document, back on the event loop, where that is safe.
+# - Requests for the same job that arrive before it has started are merged into one, that runs on the next tick.
+# - A request that arrives while the job is running makes it run once more when it is done, with the newest state.
+#   The result of the run that was overtaken is thrown away, because it belongs to an old state of the widgets.
+#
+# Without a Bokeh server (e.g. in export_html.py and benchmark.py), and while main.py is building the page, jobs are
+# simply run right away. With settings.WORKERS = 0, jobs are still merged, but they are run on the event loop.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import metrics
+import settings
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """Returns the pool of worker threads of this process, or None if settings.WORKERS is 0."""
+    global _pool
+    with _pool_lock:
+        if _pool is None and settings.WORKERS > 0:
+            _pool = ThreadPoolExecutor(max_workers=settings.WORKERS, thread_name_prefix='exopop')
+    return(_pool)
+
+
+class Scheduler(object):
+    """Merges and runs the jobs of one session (one Bokeh document). See the top of this file."""
+
+    def __init__(self, doc, pool=None):
+        self.doc = doc
+        self.pool = pool
+        self.deferred = False#Run jobs right away until start() is called.
+        self.jobs = {}#name -> (prepare, compute, apply) of the latest request.
+        self.queued = []#The names of the jobs that will start on the next tick.
+        self.running = set()
+        self.again = set()#The jobs that were requested again while they were running.
+        self.tick_pending = False
+
+    def start(self):
+        """From now on, run jobs on the next tick and in the pool, if this document belongs to a server session."""
+        self.deferred = self.doc.session_context is not None
+
+    def request(self, name, prepare, compute, apply):
+        """Asks for the job name to be run. prepare() returns what compute() needs, compute() returns what apply() needs."""
+        self.jobs[name] = (prepare, compute, apply)
+        if not self.deferred:
+            apply(compute(prepare()))
+            return
+        metrics.count('jobs_requested')
+        if name in self.running:
+            self.again.add(name)
+            return
+        if name not in self.queued:
+            self.queued.append(name)
+        if not self.tick_pending:
+            self.tick_pending = True
+            self.doc.add_next_tick_callback(self._start_queued)
+
+    def invalidate(self):
+        """Makes the jobs that are running now run once more, and drops their results. For after the data that they work
+        on was replaced (see sync.py)."""
+        self.again.update(self.running)
+
+    def _start_queued(self):
+        self.tick_pending = False
+        names, self.queued = self.queued, []
+        for name in names:
+            self._start(name)
+
+    def _start(self, name):
+        prepare, compute, apply = self.jobs[name]
+        prepared = prepare()
+        metrics.count('jobs_run')
+        if self.pool is None:
+            apply(compute(prepared))
+            return
+        self.running.add(name)
+        future = self.pool.submit(compute, prepared)
+        future.add_done_callback(lambda f: self._schedule_finish(name, f))
+
+    def _schedule_finish(self, name, future):
+        #This runs in the worker thread. Adding a callback to the document is the one thing that is safe to do from here.
+        try:
+            self.doc.add_next_tick_callback(partial(self._finish, name, future))
+        except Exception:#The session was closed in the meantime.
+            pass
+
+    def _finish(self, name, future):
+        self.running.discard(name)
+        if name in self.again:#Overtaken by a newer request. Start again, and drop this result.
+            self.again.discard(name)
+            metrics.count('jobs_dropped')
+            self._start(name)
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print('ERROR: The %s job of a session failed: %r' % (name, e))
+            return
+        self.jobs[name][2](result)
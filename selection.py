@@ -0,0 +1,250 @@
+# The range queries behind the selection sliders of the Bokeh app, the targets of plot.py, and target lists in scripts.
+#
+# Instead of comparing every planet against every slider each time a slider moves, each filterable column is sorted
+# once (per server process). The planets within a slider range are then found with two binary searches in the
+# sorted column, which costs log(n) plus the number of planets in the range. The mask of each slider is kept
+# (see cached_range_mask()), so that moving one slider only recomputes the mask of that slider.
+#
+# query_rows(), query_mask() and query_tables() select planets by ranges of columns without any widgets, for one set of
+# criteria or for thousands at once, e.g.
+#     from selection import query_tables
+#     sweep = [{'teq': (t, t+200), 'pl_rade': (r, 2*r), 'gaia_gmag': (None, 12)} for t in range(500, 2500, 200) for r in [1, 2, 4]]
+#     for targets in query_tables(sweep):
+#         print(targets['pl_name'][:5])#The five brightest in Gaia G of each set.
+# A set of criteria is a dict of column name -> (lowest, highest) value, both inclusive, with None for no limit.
+# Planets without a value in a column (NaN) never satisfy a range of that column. The sets are handled together:
+# - If the narrowest range of a set holds few planets, only those are checked against the other ranges of the set.
+#   The candidates of all such sets are gathered and checked in one go.
+# - Otherwise, the masks of the ranges of the set are combined, as for the sliders.
+
+import threading
+
+import numpy as np
+
+import metrics
+from catalog import select_rows, shared_catalog
+from derived import Catalog
+
+#The columns of the catalog that the selection sliders filter on.
+FILTER_COLUMNS = ['pl_massj', 'pl_radj', 'pl_orbper', 'pl_orbeccen', 'teq', 'st_teff', 'gaia_gmag', 'st_j']
+#A set of criteria is checked planet by planet if its narrowest range holds less than 1/SPARSE_FRACTION of all planets.
+SPARSE_FRACTION = 16
+
+
+def build_index(values):
+    """Sorts a column once. Returns a dict with the sorted values and the rows they belong to. NaNs are left out,
+    because they can never be inside a range."""
+    values = np.asarray(values)
+    nan = np.isnan(values)
+    valid = np.flatnonzero(~nan)
+    order = valid[np.argsort(values[valid], kind='stable')]
+    return({'order': order, 'values': values[order], 'nan_rows': np.flatnonzero(nan), 'n_rows': len(values)})
+
+
+def value_range(index):
+    """Returns the lowest and highest value of the column of index, like np.nanmin() and np.nanmax() but without going
+    through the column. NaN if the column has no values."""
+    if not len(index['values']):
+        return(np.nan, np.nan)
+    return(index['values'][0], index['values'][-1])
+
+
+def _bounds(index, lo, hi):
+    """Two binary searches: the sorted values from i0 up to (not including) i1 lie between lo and hi (inclusive)."""
+    return(np.searchsorted(index['values'], lo, side='left'), np.searchsorted(index['values'], hi, side='right'))
+
+
+def range_rows(index, lo, hi):
+    """Returns the rows of which the value lies between lo and hi (inclusive)."""
+    i0, i1 = _bounds(index, lo, hi)
+    return(index['order'][i0:i1])
+
+
+def range_mask(index, lo, hi):
+    """Returns a boolean mask over all rows that is True where the value lies between lo and hi (inclusive)."""
+    i0, i1 = _bounds(index, lo, hi)
+    if 2*(i1-i0) < index['n_rows']:#Few rows are inside the range: switch those on.
+        mask = np.zeros(index['n_rows'], dtype=bool)
+        mask[index['order'][i0:i1]] = True
+    else:#Most rows are inside the range: switch the others off. That's fewer writes.
+        mask = np.ones(index['n_rows'], dtype=bool)
+        mask[index['order'][:i0]] = False
+        mask[index['order'][i1:]] = False
+        mask[index['nan_rows']] = False
+    return(mask)
+
+
+def cached_range_mask(cache, key, index, lo, hi):
+    """Returns range_mask(index, lo, hi), reusing the mask stored under key in the dict cache if it was made for the
+    same range. The cache belongs to one session; the index is shared."""
+    hit = cache.get(key)
+    if hit is None or hit[0] != (lo, hi):
+        cache[key] = ((lo, hi), range_mask(index, lo, hi))
+    return(cache[key][1])
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+@metrics.timed('build_indexes')
+def shared_indexes():
+    """Returns the indexes of FILTER_COLUMNS of the shared catalog, built once for every shared catalog. If the catalog
+    was mapped from the store (see store.py), the indexes were mapped along with it."""
+    global _shared
+    catalog = shared_catalog()
+    with _shared_lock:
+        if _shared is None or _shared[0] is not catalog:#The catalog was swapped in since (see catalog.swap_in()).
+            indexes = getattr(catalog, 'indexes', None)
+            if indexes is None:
+                indexes = {name: build_index(catalog[name]) for name in FILTER_COLUMNS}
+            _shared = (catalog, indexes)
+    return(_shared[1])
+
+
+def _limits(criterion):
+    """Turns (lo, hi) with None for no limit into two numbers."""
+    lo, hi = criterion
+    return(-np.inf if lo is None else lo, np.inf if hi is None else hi)
+
+
+def _evaluate(sets, catalog, indexes, cache=None):
+    """Finds the planets that satisfy each of the sets of criteria. Returns for every set either the array of rows
+    (in increasing order), or a boolean mask over all rows, whichever was cheaper to make."""
+    n_rows = len(catalog['pl_name'])
+    sets = [{name: _limits(criterion) for name, criterion in s.items()} for s in sets]
+    names = sorted(set().union(*sets)) if sets else []
+    bounds = {}#name -> the lower and upper limits in every set, and whether the set has a range of that column.
+    for name in names:
+        has = np.array([name in s for s in sets])
+        lo = np.array([s[name][0] if name in s else -np.inf for s in sets], dtype=np.float64)
+        hi = np.array([s[name][1] if name in s else np.inf for s in sets], dtype=np.float64)
+        bounds[name] = (lo, hi, has)
+
+    #For every set, the indexed column with the fewest planets in range: two binary searches per set, for all sets at once.
+    fewest = np.full(len(sets), n_rows)
+    best = np.full(len(sets), -1)
+    edges = {}
+    for j, name in enumerate(names):
+        if name not in indexes:
+            continue
+        lo, hi, has = bounds[name]
+        i0 = np.searchsorted(indexes[name]['values'], lo, side='left')
+        i1 = np.searchsorted(indexes[name]['values'], hi, side='right')
+        edges[name] = (i0, i1)
+        count = np.where(has, i1-i0, n_rows)
+        better = count < fewest
+        fewest[better] = count[better]
+        best[better] = j
+    sparse = (best >= 0) & (fewest*SPARSE_FRACTION < n_rows)
+    results = [None]*len(sets)
+
+    if np.any(sparse):
+        #Gather the planets in the narrowest range of each of these sets, and which set they are candidates for.
+        rows = [np.zeros(0, dtype=np.intp)]
+        owner = [np.zeros(0, dtype=np.intp)]
+        for j, name in enumerate(names):
+            chosen = np.flatnonzero(sparse & (best == j))
+            if not len(chosen):
+                continue
+            i0, i1 = edges[name][0][chosen], edges[name][1][chosen]
+            lengths = i1-i0
+            offsets = np.cumsum(lengths)-lengths#Where the rows of each set start in the gathered array.
+            positions = np.arange(lengths.sum())+np.repeat(i0-offsets, lengths)
+            rows.append(indexes[name]['order'][positions])
+            owner.append(np.repeat(chosen, lengths))
+        rows = np.concatenate(rows)
+        owner = np.concatenate(owner)
+        #Check the candidates against all ranges of their set at once.
+        ok = np.ones(len(rows), dtype=bool)
+        for name in names:
+            lo, hi, has = bounds[name]
+            values = catalog[name][rows]
+            ok &= ~has[owner] | ((values >= lo[owner]) & (values <= hi[owner]))
+        rows, owner = rows[ok], owner[ok]
+        order = np.lexsort((rows, owner))
+        rows, owner = rows[order], owner[order]
+        starts = np.searchsorted(owner, np.arange(len(sets)+1))
+        for k in np.flatnonzero(sparse):
+            results[k] = rows[starts[k]:starts[k+1]]
+
+    for k in np.flatnonzero(~sparse):#Most planets are in range: combine the masks of the ranges.
+        mask = np.ones(n_rows, dtype=bool)
+        for name, (lo, hi) in sets[k].items():
+            if name not in indexes:
+                values = catalog[name]
+                mask &= (values >= lo) & (values <= hi)
+            elif cache is not None:
+                mask &= cached_range_mask(cache, name, indexes[name], lo, hi)
+            else:
+                mask &= range_mask(indexes[name], lo, hi)
+        results[k] = mask
+    return(results)
+
+
+_extra = (None, {})#The indexes of other columns of the shared catalog that were queried, see _defaults().
+
+
+def _defaults(catalog, indexes, criteria=()):
+    """Without a catalog, queries go to the shared catalog, with its indexes. Other columns of it that are queried get an
+    index too, which is kept. In other catalogs, columns without an index are compared directly."""
+    global _extra
+    if catalog is not None:
+        return(catalog, {} if indexes is None else indexes)
+    catalog = shared_catalog()
+    if indexes is not None:
+        return(catalog, indexes)
+    indexes = shared_indexes()
+    names = set().union(*([criteria] if isinstance(criteria, dict) else criteria)) - set(indexes)
+    with _shared_lock:
+        if _extra[0] is not catalog:
+            _extra = (catalog, {})
+        for name in names:
+            if name not in _extra[1]:
+                _extra[1][name] = build_index(catalog[name])
+    return(catalog, dict(indexes, **_extra[1]))
+
+
+@metrics.timed('query_rows')
+def query_rows(criteria, catalog=None, indexes=None, sort_by='gaia_gmag'):
+    """Returns the rows of the planets that satisfy criteria, sorted by the column sort_by (brightest first, by default),
+    or in the order of the catalog if sort_by is None. Planets without a value of sort_by come last.
+
+    criteria is one set of criteria (a dict, see the top of this file), or a list of them. In the latter case, a list
+    with the rows for each set is returned. By default the shared catalog is queried; for another catalog, indexes
+    can be given as a dict of column name -> build_index() of that column."""
+    catalog, indexes = _defaults(catalog, indexes, criteria)
+    single = isinstance(criteria, dict)
+    found = []
+    for result in _evaluate([criteria] if single else list(criteria), catalog, indexes):
+        rows = np.flatnonzero(result) if result.dtype == bool else result
+        if sort_by is not None:
+            rows = rows[np.argsort(catalog[sort_by][rows], kind='stable')]
+        found.append(rows)
+    return(found[0] if single else found)
+
+
+def query_mask(criteria, catalog=None, indexes=None, cache=None):
+    """Returns a boolean mask over all planets that is True where one set of criteria is satisfied. This is what the
+    sliders of the app use: cache is then the dict in which the masks of the sliders are kept (see cached_range_mask())."""
+    catalog, indexes = _defaults(catalog, indexes, criteria)
+    result = _evaluate([criteria], catalog, indexes, cache)[0]
+    if result.dtype == bool:
+        return(result)
+    mask = np.zeros(len(catalog['pl_name']), dtype=bool)
+    mask[result] = True
+    return(mask)
+
+
+def query_tables(criteria, catalog=None, indexes=None, sort_by='gaia_gmag', columns=None):
+    """Like query_rows(), but returns the selected planets as catalogs (dicts of column -> array) with the given columns,
+    or all columns if columns is None. These can be printed with e.g. astropy.table.Table(targets).pprint()."""
+    catalog, indexes = _defaults(catalog, indexes, criteria)
+    def table(rows):
+        if columns is None:
+            return(select_rows(catalog, rows))
+        return(Catalog({name: catalog[name][rows] for name in columns}))
+    found = query_rows(criteria, catalog, indexes, sort_by)
+    if isinstance(criteria, dict):
+        return(table(found))
+    return([table(rows) for rows in found])
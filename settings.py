@@ -0,0 +1,64 @@
+# Settings of the exoplanet population explorer.
+# Every setting can be overridden with an environment variable, so that the Bokeh server can be configured without
+# touching the code. E.g. to start the app on a machine that can't reach the archive:
+# EXOPOP_OFFLINE=1 bokeh serve --show /home/user/plot_population
+
+import os
+from os.path import dirname, join
+
+
+def _flag(name, default=False):
+    """Reads a yes/no environment variable. Anything other than 0, no, false, off or empty counts as yes."""
+    value = os.environ.get(name)
+    if value is None:
+        return(default)
+    return(value.strip().lower() not in ['', '0', 'no', 'false', 'off'])
+
+
+#Where the local snapshot of the archive table lives.
+CACHE_DIR = os.environ.get('EXOPOP_CACHE_DIR', join(dirname(__file__), 'cache'))
+#How old (in seconds) the snapshot may get before the archive is queried again, at start-up or when a session starts
+#(see sync.refresh_when_expired()). Default is one day.
+CACHE_TTL = float(os.environ.get('EXOPOP_CACHE_TTL', 24*3600))
+#Never touch the network; only use the snapshot.
+OFFLINE = _flag('EXOPOP_OFFLINE')
+#Query the archive on start-up regardless of the age of the snapshot.
+REFRESH = _flag('EXOPOP_REFRESH')
+#Prepare the catalog only once per machine, and map it read-only into every server process (see store.py), instead
+#of preparing it in every process. STORE_DIR is where it is kept.
+SHARED_STORE = _flag('EXOPOP_SHARED_STORE')
+STORE_DIR = os.environ.get('EXOPOP_STORE_DIR', CACHE_DIR.rstrip('/\\') + '_store')
+#Every this many seconds, fetch the planets that were added or updated in the archive since the snapshot, and show them
+#in the open sessions (see sync.py). 0 switches this off. SYNC_SOURCE is a folder of canned deltas to use instead of the archive.
+SYNC_INTERVAL = float(os.environ.get('EXOPOP_SYNC_INTERVAL', 0))
+SYNC_SOURCE = os.environ.get('EXOPOP_SYNC_SOURCE', '')
+#Draw the selected planets from the table of all planets through an index filter, so that a change of the selection
+#only sends row numbers to the browser. When off (the default), the selected planets are sent as a separate table.
+INDEX_SELECTION = _flag('EXOPOP_INDEX_SELECTION')
+#Do all filtering and switching of axes and units in the browser, so that the server only has to send the page once.
+#This is also the mode in which export_html.py saves the app as a standalone HTML file.
+CLIENT_SIDE = _flag('EXOPOP_CLIENT_SIDE')
+#Draw the population as a grid of cells shaded by the number of planets in them, for catalogs that are too large to be
+#drawn planet by planet (see density.py). The planets themselves are drawn once fewer than POINT_LIMIT are in view.
+AGGREGATE = _flag('EXOPOP_AGGREGATE')
+POINT_LIMIT = int(os.environ.get('EXOPOP_POINT_LIMIT', 20000))
+#The number of cells along each axis in the density mode.
+GRID_SIZE = int(os.environ.get('EXOPOP_GRID_SIZE', 150))
+#Show histograms of the x and the y values next to the plot, of all planets and of the selected ones (see histograms.py),
+#with HIST_BINS bins each. These are not available in the client-side mode.
+MARGINALS = _flag('EXOPOP_MARGINALS')
+HIST_BINS = int(os.environ.get('EXOPOP_HIST_BINS', 40))
+#Send only the positions of the planets to the browser, and the contents of their tooltips only when they are hovered
+#(see tooltips.py), instead of a dozen columns for every planet up front.
+TOOLTIP_DETAILS = _flag('EXOPOP_TOOLTIP_DETAILS')
+#Time the callbacks and the loading of the catalog, and count the traffic and the sessions (see metrics.py).
+METRICS = _flag('EXOPOP_METRICS')
+#Show these timings and counts in a panel below the plot. This turns on METRICS.
+METRICS_PANEL = _flag('EXOPOP_METRICS_PANEL')
+#Serve them on http://localhost:<port>/metrics for monitoring (0 is off), and/or write every timing as a line of JSON to
+#this file. Either turns on METRICS.
+METRICS_PORT = int(os.environ.get('EXOPOP_METRICS_PORT', 0))
+METRICS_LOG = os.environ.get('EXOPOP_METRICS_LOG', '')
+#The number of threads per server process that do the heavy work of the callbacks, so that one busy session doesn't
+#block the others (see scheduler.py). With 0, that work is done on the event loop of the server.
+WORKERS = int(os.environ.get('EXOPOP_WORKERS', 2))
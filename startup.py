@@ -0,0 +1,108 @@
+# A report of where the time goes when the app starts: importing the modules, loading the catalog, and making the first
+# sessions. This is what a user waits for before the first plot appears, before any network access.
+#
+# The app is started in a fresh Python process (with python -X importtime, which times every import), the same way the
+# Bokeh server starts it: on_server_loaded() (see app_hooks.py), and then main.py for a first and a second session.
+# The report lists the time of each of those steps, the import time per package, the steps of loading the catalog
+# (see metrics.py), and whether astropy or astroquery were imported: they are only needed to query the archive, and
+# importing them takes longer than the rest of the start-up. Usage:
+#     python startup.py [--top 10] [--output report.json]
+# Settings of the app are passed on to it, e.g. EXOPOP_SHARED_STORE=1 python startup.py.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from os.path import abspath, dirname
+
+APP_DIR = dirname(abspath(__file__))
+HEAVY = ['astropy', 'astroquery']#Only needed to query the archive.
+
+
+def measure():
+    """Starts the app step by step, and returns the time of each step. This runs in the process started by profile()."""
+    steps = []
+    t = [time.perf_counter()]
+    def step(name):
+        now = time.perf_counter()
+        steps.append([name, now-t[0]])
+        t[0] = now
+
+    import numpy#Imported by everything else, so timed on its own.
+    step('import numpy')
+    from bokeh.application import Application
+    from bokeh.application.handlers import DirectoryHandler
+    step('import bokeh')
+    import app_hooks
+    import metrics
+    step('import the app')
+    app_hooks.on_server_loaded(None)
+    step('load the catalog')
+    app = Application(DirectoryHandler(filename=APP_DIR))
+    step('read main.py')
+    for name in ['first session', 'next session']:
+        app.create_document()
+        for handler in app.handlers:
+            if handler.failed:
+                raise RuntimeError('Could not build the app:\n%s' % handler.error_detail)
+        step(name)
+    timings = metrics.snapshot()['timings']
+    return({'steps': steps, 'stages': {k: v['total_s'] for k, v in timings.items()},
+            'heavy': [name for name in HEAVY if name in sys.modules]})
+
+
+def import_times(lines):
+    """Adds up the own time of every import in the output of python -X importtime, per top-level package."""
+    packages = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0)+int(self_us)/1e6
+    return(packages)
+
+
+def profile():
+    """Runs measure() in a fresh process, and returns its results with the import times per package."""
+    env = dict(os.environ, EXOPOP_METRICS='1')
+    out = subprocess.run([sys.executable, '-X', 'importtime', abspath(__file__), '--measure'], env=env, cwd=APP_DIR,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    report = json.loads(out.stdout.decode().strip().split('\n')[-1])
+    report['imports'] = import_times(out.stderr.decode().split('\n'))
+    return(report)
+
+
+def print_report(report, top=10):
+    print('Start-up, step by step:')
+    for name, seconds in report['steps']:
+        print('  %-24s %8.3f s' % (name, seconds))
+    print('  %-24s %8.3f s' % ('total', sum(s for n, s in report['steps'])))
+    print('Import time per package (own time of its modules):')
+    for name, seconds in sorted(report['imports'].items(), key=lambda item: -item[1])[:top]:
+        print('  %-24s %8.3f s' % (name, seconds))
+    print('Loading the catalog and the first sessions (see metrics.py):')
+    for name, seconds in sorted(report['stages'].items(), key=lambda item: -item[1])[:top]:
+        print('  %-24s %8.3f s' % (name, seconds))
+    if report['heavy']:
+        print('WARNING: %s imported, which is only needed to query the archive.' % ' and '.join(report['heavy']))
+    else:
+        print('%s not imported.' % ' and '.join(HEAVY))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report where the start-up time of the app goes.')
+    parser.add_argument('--top', type=int, default=10, help='The number of packages and steps to list.')
+    parser.add_argument('--output', help='Also write the report to this JSON file.')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)#The process started by profile().
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure()))
+    else:
+        report = profile()
+        print_report(report, args.top)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=1)
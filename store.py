@@ -0,0 +1,190 @@
+# A memory-mapped copy of the prepared catalog, shared by all server processes on a machine (settings.SHARED_STORE).
+#
+# With bokeh serve --num-procs N, every process used to read the snapshot, select the transiting planets, compute the
+# derived columns and sort the filter columns for itself, and to keep its own copy of all of that in memory. Instead, the
+# first process that needs the prepared catalog now publishes it here, once: every column (the derived ones included)
+# and the indexes of the selection sliders (see selection.py), as one .npy file each. All processes then map these
+# files read-only (numpy.load with mmap_mode='r'), without copying them. The operating system keeps a single copy in
+# memory for all processes, and starting another process costs little more than opening the files.
+#
+# Each published catalog has a folder of its own under settings.STORE_DIR, named after the snapshot it was made from.
+# The file CURRENT holds the name of the folder to use. A folder is written completely before CURRENT is replaced
+# (which is atomic), so a process never maps half a catalog. Processes that are running switch to a newly published
+# catalog when the next session starts (see catalog.swap_in()); sessions that are open keep the catalog they started
+# with. A new catalog is published by the first process that starts after the snapshot has expired, or by running
+#     EXOPOP_REFRESH=1 python store.py
+# e.g. from a daily cron job, so that the servers never have to wait for the archive themselves.
+
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+from os.path import exists, join
+
+import numpy as np
+
+import metrics
+import settings
+from catalog import SNAPSHOT_VERSION, prep_table, snapshot_fetched, snapshot_age
+from derived import Catalog, DERIVED
+from selection import FILTER_COLUMNS, build_index
+
+STORE_VERSION = 1#Catalogs published by older versions of this module are ignored, and published again.
+CURRENT_FILE = 'CURRENT'
+META_FILE = 'meta.json'
+INDEX_PARTS = ['order', 'values', 'nan_rows']#The arrays of an index, see selection.build_index().
+
+_started = time.time()
+
+
+def current_name(path=settings.STORE_DIR):
+    """Returns the name of the folder of the current catalog in the store, or None if nothing was published yet."""
+    try:
+        with open(join(path, CURRENT_FILE)) as f:
+            return(f.read().strip() or None)
+    except OSError:
+        return(None)
+
+
+def _read_meta(name, path):
+    try:
+        with open(join(path, name, META_FILE)) as f:
+            return(json.load(f))
+    except (OSError, ValueError):
+        return(None)
+
+
+def is_compatible(name, path=settings.STORE_DIR):
+    """Returns True if the published catalog name is complete, and was made by this version of the app."""
+    meta = _read_meta(name, path)
+    return(meta is not None and meta['version'] == STORE_VERSION and meta['snapshot_version'] == SNAPSHOT_VERSION)
+
+
+def is_stale(name, path=settings.STORE_DIR, refresh=settings.REFRESH, offline=settings.OFFLINE, ttl=settings.CACHE_TTL):
+    """Returns True if the published catalog name should be made again: because it was made by an older version of
+    the app or from another snapshot than the one on disk, or because the snapshot is due for a refresh (see
+    catalog.load_catalog()). A refresh asked for at start-up is done only once, by the first process."""
+    if not is_compatible(name, path):
+        return(True)
+    meta = _read_meta(name, path)
+    if meta['fetched'] != snapshot_fetched():
+        return(True)
+    if offline:
+        return(False)
+    if refresh and meta['fetched'] < _started:
+        return(True)
+    age = snapshot_age()
+    return(age is None or age > ttl)
+
+
+_held = threading.local()#The folders that this thread holds the lock of, see locked().
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Only one process at a time gets past this, so that the catalog is prepared once, not once per process. A thread
+    that holds the lock already gets past it again (e.g. sync.py writes the snapshot while it holds the store)."""
+    key = os.path.abspath(path)
+    held = _held.__dict__.setdefault('folders', set())
+    if key in held:
+        yield
+        return
+    os.makedirs(path, exist_ok=True)
+    with open(join(path, '.lock'), 'w') as f:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)#Let go of when the file is closed.
+        except ImportError:#Windows. At worst, the catalog is prepared by more than one process.
+            pass
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+
+
+def publish(catalog, fetched, path=settings.STORE_DIR):
+    """Writes catalog, all of its derived columns and the indexes of its filter columns to a new folder in the store,
+    and makes that the current one. fetched is the time at which the snapshot was fetched. Returns the name of the folder."""
+    name = 'snapshot-%.3f' % fetched
+    folder = join(path, name)
+    if not exists(folder):
+        tmp = folder + '.tmp%s' % os.getpid()
+        if exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        columns = list(catalog.keys()) + sorted(n for n in DERIVED if not dict.__contains__(catalog, n))
+        for n in columns:
+            np.save(join(tmp, '%s.npy' % n), np.ascontiguousarray(catalog[n]), allow_pickle=False)
+        for n in FILTER_COLUMNS:
+            index = build_index(catalog[n])
+            for part in INDEX_PARTS:
+                np.save(join(tmp, 'index.%s.%s.npy' % (n, part)), index[part], allow_pickle=False)
+        with open(join(tmp, META_FILE), 'w') as f:
+            json.dump({'version': STORE_VERSION, 'snapshot_version': SNAPSHOT_VERSION, 'fetched': fetched,
+                       'rows': len(catalog['pl_name']), 'columns': columns, 'indexes': FILTER_COLUMNS}, f)
+        os.rename(tmp, folder)
+
+    pointer = join(path, CURRENT_FILE + '.tmp%s' % os.getpid())
+    with open(pointer, 'w') as f:
+        f.write(name)
+    os.replace(pointer, join(path, CURRENT_FILE))#Atomic: a reader sees either the old name or the new one.
+
+    #Older catalogs can go. On Linux and macOS, processes that still map them keep them until they let go; elsewhere
+    #the files are in use, and stay until the next time.
+    for old in os.listdir(path):
+        if old.startswith('snapshot-') and old != name:
+            shutil.rmtree(join(path, old), ignore_errors=True)
+    return(name)
+
+
+def _map(filename):
+    #A plain ndarray on top of the memory map, so that slices of it don't pretend to be memory maps too.
+    return(np.load(filename, mmap_mode='r', allow_pickle=False).view(np.ndarray))
+
+
+@metrics.timed('open_store')
+def open_store(name, path=settings.STORE_DIR):
+    """Maps the published catalog name read-only, without reading it. Returns it as a catalog, with the indexes of the
+    selection sliders as its attribute indexes."""
+    folder = join(path, name)
+    meta = _read_meta(name, path)
+    if meta is None:
+        raise FileNotFoundError('There is no catalog %s in the store %s.' % (name, path))
+    catalog = Catalog({n: _map(join(folder, '%s.npy' % n)) for n in meta['columns']}, readonly=True)
+    catalog.indexes = {}
+    for n in meta['indexes']:
+        catalog.indexes[n] = {part: _map(join(folder, 'index.%s.%s.npy' % (n, part))) for part in INDEX_PARTS}
+        catalog.indexes[n]['n_rows'] = meta['rows']
+    catalog.store_name = name
+    return(catalog)
+
+
+def load(path=settings.STORE_DIR):
+    """Returns the prepared catalog, mapped from the store. If the store has no current catalog for the snapshot, it is
+    prepared (see catalog.prep_table()) and published first."""
+    while True:
+        name = current_name(path)
+        if name is None or is_stale(name, path):
+            with locked(path):
+                name = current_name(path)#Another process may have published it while this one waited.
+                if name is None or is_stale(name, path):
+                    with metrics.stage('publish_store'):
+                        catalog = prep_table()
+                        name = publish(catalog, snapshot_fetched(), path)
+        try:
+            return(open_store(name, path))
+        except FileNotFoundError:#Removed by another process, which has just published a newer one. Map that instead.
+            if current_name(path) == name:
+                raise
+
+
+if __name__ == '__main__':
+    name = current_name()
+    if name is not None and not is_stale(name):
+        print('The catalog in %s is up to date: %s' % (settings.STORE_DIR, name))
+    else:
+        load()
+        print('Published %s in %s' % (current_name(), settings.STORE_DIR))
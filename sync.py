@@ -0,0 +1,301 @@
+# Bringing the catalog up to date with the archive while the app is running, without fetching the whole table again.
+#
+# The archive keeps the date at which each row was last changed (rowupdate). sync() asks it only for the planets that
+# were added or changed since the snapshot was made (the delta), and merges those into the snapshot: planets that are
+# in it already are replaced in place, new ones are added at the end. The prepared catalog is then published in the
+# store (see store.py), with the derived columns computed again only for the planets that were added or changed.
+#
+# The server processes look for a newly published catalog every settings.SYNC_INTERVAL seconds (see app_hooks.py), and
+# the first one to find that the snapshot is due also runs sync() itself. Every process then swaps in the new catalog,
+# and tells its open sessions what changed (see watch()), so that they only send the changed planets to the browser as
+# patches and the new ones as a stream (see apply_sync() in main.py), instead of all tables again.
+#
+# Without settings.SYNC_INTERVAL, the snapshot still expires after settings.CACHE_TTL: the first session that starts
+# after that makes the process query the archive for the whole table again, in the background (see refresh()). The
+# catalog is then swapped in like after a sync, but the open sessions are usually sent all tables again.
+#
+# Instead of the archive, the delta can be read from a folder of canned deltas (settings.SYNC_SOURCE), e.g. to try
+# this without network access or to test it. See CannedArchive and synthetic.write_delta(). To sync by hand:
+#     python sync.py [--canned /some/folder]
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+from functools import partial
+from os.path import join
+
+import numpy as np
+
+import metrics
+import settings
+import store
+from catalog import COLUMNS, load_catalog, project, read_snapshot, select_rows, shared_catalog, snapshot_fetched, snapshot_folder, swap_in, write_snapshot
+from derived import Catalog, DERIVED
+from selection import shared_indexes
+
+DELTA_COLUMNS = list(COLUMNS)+['rowupdate']#rowupdate is the date ('2026-10-18') at which the archive last changed the row.
+SYNC_FILE = 'synced.json'#In the snapshot folder: when sync() last found that there was nothing new.
+
+
+def fetch_delta(since):
+    """Queries the NASA Exoplanet Archive for the planets that were added or updated after the date since ('YYYY-MM-DD').
+    Returns them as a catalog (see catalog.project()), with the column rowupdate as well."""
+    from astroquery.nasa_exoplanet_archive import NasaExoplanetArchive#Only needed when actually fetching.
+    table = NasaExoplanetArchive.query_criteria(table='exoplanets', select='*', where="rowupdate > '%s'" % since)
+    delta = project(table)
+    delta['rowupdate'] = np.asarray(table['rowupdate']).astype(str)
+    return(delta)
+
+
+class CannedArchive(object):
+    """Stands in for the archive: serves the rows of the deltas saved in folder (delta-*.npz, see synthetic.write_delta())
+    that were updated after the requested date."""
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def __call__(self, since):
+        parts = []
+        for filename in sorted(glob.glob(join(self.folder, 'delta-*.npz'))):
+            with np.load(filename, allow_pickle=False) as f:
+                parts.append({name: f[name] for name in DELTA_COLUMNS})
+        if not parts:
+            return({name: np.zeros(0) for name in DELTA_COLUMNS})
+        delta = {name: np.concatenate([p[name] for p in parts]) for name in DELTA_COLUMNS}
+        return(select_rows(delta, delta['rowupdate'] > since))
+
+
+def default_source():
+    """The archive, or the canned deltas in settings.SYNC_SOURCE if that is set."""
+    if settings.SYNC_SOURCE:
+        return(CannedArchive(settings.SYNC_SOURCE))
+    return(fetch_delta)
+
+
+def merge(catalog, delta):
+    """Returns catalog (a snapshot, see catalog.py) with the planets of delta merged in: planets that are in catalog
+    already are replaced where they are, new ones are added at the end. If a planet is in delta more than once, its
+    last row counts."""
+    if not len(delta['pl_name']):
+        return(dict(catalog))
+    names = np.asarray(delta['pl_name'])
+    last = len(names)-1-np.unique(names[::-1], return_index=True)[1]#The last row of every planet in the delta.
+    last.sort()
+    where = {name: i for i, name in enumerate(catalog['pl_name'])}
+    rows = np.array([where.get(name, -1) for name in names[last]], dtype=np.intp)
+    known = rows >= 0
+    merged = {}
+    for name in COLUMNS:
+        new = np.asarray(delta[name])[last]
+        column = np.concatenate([catalog[name], new[~known]])#Also widens string columns, if need be.
+        column[rows[known]] = new[known]
+        merged[name] = np.ascontiguousarray(column)
+    return(merged)
+
+
+def changes(old, new):
+    """Compares two prepared catalogs. If all planets of old are still in the same rows in new, returns the rows of old
+    of which any column changed, and the number of planets added at the end. Otherwise (e.g. a planet is no longer
+    transiting) returns None."""
+    n = len(old['pl_name'])
+    if len(new['pl_name']) < n or not np.array_equal(old['pl_name'], new['pl_name'][:n]):
+        return(None)
+    changed = np.zeros(n, dtype=bool)
+    for name in COLUMNS:
+        a, b = old[name], new[name][:n]
+        if a.dtype.kind == 'f':
+            changed |= ~((a == b) | (np.isnan(a) & np.isnan(b)))
+        else:
+            changed |= a != b
+    return(np.flatnonzero(changed), len(new['pl_name'])-n)
+
+
+def prepare_update(old, snapshot):
+    """Returns the prepared catalog of snapshot (the transiting planets, see catalog.prep_table()). The derived columns
+    that old (the previous prepared catalog) has are copied from it, and computed only for the planets that changed or
+    were added. That works because every derived column is computed row by row (see derived.py)."""
+    new = select_rows(snapshot, snapshot['pl_tranflag'])
+    found = None if old is None else changes(old, new)
+    if found is None:#The derived columns are computed for all planets, when they are asked for.
+        return(new)
+    rows, added = found
+    n = len(old['pl_name'])
+    affected = np.concatenate([rows, np.arange(n, n+added)])
+    part = select_rows(new, affected)
+    columns = dict(new)
+    for name in DERIVED:
+        if dict.__contains__(old, name):
+            column = np.empty(len(new['pl_name']))
+            column[:n] = old[name]
+            column[affected] = part[name]
+            columns[name] = column
+    return(Catalog(columns))
+
+
+def last_synced(path=settings.CACHE_DIR):
+    """Returns the time since which the snapshot at path is known to be up to date with the archive: when it was fetched,
+    or when sync() last found nothing new, whichever is later. None if there is no (complete, current) snapshot."""
+    fetched = snapshot_fetched(path)
+    if fetched is None:
+        return(None)
+    try:
+        with open(join(snapshot_folder(path), SYNC_FILE)) as f:
+            synced = json.load(f)['synced']
+    except (OSError, ValueError, KeyError):
+        return(fetched)
+    return(max(fetched, synced))
+
+
+def _mark_synced(synced, path):
+    """Records that the snapshot at path was up to date with the archive at the time synced. The snapshot itself stays as
+    it is, because a newer snapshot makes the servers prepare the catalog again."""
+    folder = snapshot_folder(path)
+    tmp = join(folder, SYNC_FILE+'.tmp%s' % os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump({'synced': synced}, f)
+    os.replace(tmp, join(folder, SYNC_FILE))
+
+
+@metrics.timed('sync')
+def sync(fetch=None, path=settings.CACHE_DIR, store_path=settings.STORE_DIR, interval=0):
+    """Fetches the planets that were added or updated since the snapshot at path was made, merges them into it, and
+    publishes the result in the store. Returns the number of planets that changed and that were added. Nothing is done
+    if the snapshot was brought up to date less than interval seconds ago (e.g. because another process has just done
+    this), see last_synced()."""
+    fetch = fetch or default_source()
+    with store.locked(store_path):
+        synced = last_synced(path)
+        if synced is None:
+            raise RuntimeError('There is no snapshot in %s to bring up to date. Start the app once first.' % path)
+        if time.time()-synced < interval:
+            return(0, 0)
+        #rowupdate is only a date, so look back a day to be sure. Merging a planet that didn't change does no harm.
+        since = time.strftime('%Y-%m-%d', time.gmtime(synced-24*3600))
+        started = time.time()#Whatever the archive changes after this is found the next time.
+        with metrics.stage('fetch_delta'):
+            delta = fetch(since)
+        old_snapshot = read_snapshot(path)
+        snapshot = merge(old_snapshot, delta)
+        found = changes(old_snapshot, snapshot)#Never None: merge() keeps every planet where it was.
+        if not len(found[0]) and not found[1]:#Nothing new. The snapshot stays as it is, and so does the store.
+            _mark_synced(started, path)
+            return(0, 0)
+        write_snapshot(snapshot, path)
+        if settings.SHARED_STORE:
+            name = store.current_name(store_path)
+            old = store.open_store(name, store_path) if name is not None and store.is_compatible(name, store_path) else None
+            store.publish(prepare_update(old, snapshot), snapshot_fetched(path), store_path)
+    print('Synchronised with the archive: %i planets changed, %i added.' % (len(found[0]), found[1]))
+    return(len(found[0]), found[1])
+
+
+def sync_due(interval=settings.SYNC_INTERVAL, path=settings.CACHE_DIR):
+    """Returns True if the snapshot was last brought up to date more than interval seconds ago (see last_synced())."""
+    synced = last_synced(path)
+    return(synced is not None and time.time()-synced > interval)
+
+
+#The open sessions of this process that want to hear about a new catalog: document -> function(catalog, changes).
+_watchers = weakref.WeakKeyDictionary()
+_watchers_lock = threading.Lock()
+
+
+def watch(doc, update):
+    """Calls update(catalog, found) on the next tick of the session of doc, whenever a new shared catalog is swapped in.
+    found is what changes() found between the old and the new catalog."""
+    with _watchers_lock:
+        _watchers[doc] = update
+
+
+def unwatch(doc):
+    with _watchers_lock:
+        _watchers.pop(doc, None)
+
+
+def swap_and_notify():
+    """Swaps in the catalog that is current in the store, if it is new, and tells the open sessions. Returns the number
+    of sessions told."""
+    old = shared_catalog()
+    if not swap_in():
+        return(0)
+    new = shared_catalog()
+    shared_indexes()
+    found = changes(old, new)
+    with _watchers_lock:
+        watchers = list(_watchers.items())
+    for doc, update in watchers:
+        try:
+            doc.add_next_tick_callback(partial(update, new, found))
+        except Exception:#The session was closed in the meantime.
+            unwatch(doc)
+    metrics.count('catalogs_swapped')
+    return(len(watchers))
+
+
+RETRY_INTERVAL = 600#Seconds between attempts of refresh(), in case the archive can't be reached.
+_refreshing = None#The refresh that is running in this process, see refresh_when_expired().
+_tried = 0.0
+
+
+def expired(ttl=settings.CACHE_TTL, path=settings.CACHE_DIR):
+    """Returns True if the snapshot was last brought up to date more than ttl seconds ago (see last_synced()), so that
+    the whole table should be queried again (see catalog.load_catalog()). Never in offline mode."""
+    synced = last_synced(path)
+    return(not settings.OFFLINE and synced is not None and time.time()-synced > ttl)
+
+
+def refresh(ttl=settings.CACHE_TTL, path=settings.CACHE_DIR, store_path=settings.STORE_DIR):
+    """Queries the archive for the whole table again if the snapshot has expired, and publishes the new catalog in the
+    store. Returns True if there is a new snapshot. If the archive can't be reached, the old snapshot is kept."""
+    with store.locked(store_path):
+        if not expired(ttl, path):#Another process has just done this.
+            return(False)
+        fetched = snapshot_fetched(path)
+        load_catalog(refresh=True, path=path)
+        if snapshot_fetched(path) == fetched:
+            return(False)
+        if settings.SHARED_STORE:
+            store.load(store_path)
+    return(True)
+
+
+async def _refresh_and_notify():
+    import asyncio
+    if await asyncio.get_running_loop().run_in_executor(None, refresh):
+        swap_and_notify()
+
+
+def refresh_when_expired():
+    """Starts refresh() in the background if the snapshot has expired, and swaps in the new catalog when it is done.
+    This is called for every new session (see app_hooks.py), which doesn't wait for it: it gets the current catalog."""
+    global _refreshing, _tried
+    if _refreshing is not None and not _refreshing.done():
+        return
+    if time.time()-_tried < RETRY_INTERVAL or not expired():
+        return
+    import asyncio
+    _tried = time.time()
+    _refreshing = asyncio.ensure_future(_refresh_and_notify())
+
+
+async def check_for_updates():
+    """The periodic callback of every server process (see app_hooks.py): runs sync() if it is due, in a thread so that
+    the sessions don't have to wait for the archive, and then swaps in the new catalog if there is one."""
+    import asyncio
+    if sync_due():
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, partial(sync, interval=settings.SYNC_INTERVAL))
+        except Exception as e:
+            print('WARNING: Could not synchronise with the archive (%s). Trying again later.' % e)
+    swap_and_notify()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge the planets added or updated in the archive into the snapshot.')
+    parser.add_argument('--canned', help='Read the deltas from this folder instead of the archive (see CannedArchive).')
+    args = parser.parse_args()
+    sync(CannedArchive(args.canned) if args.canned else None)
@@ -0,0 +1,120 @@
+# Synthetic planet catalogs, for testing and benchmarking the app without the archive (see benchmark.py).
+#
+# The catalogs made here have exactly the columns and units of the catalog in catalog.py (see catalog.COLUMNS), so they
+# can be written as a snapshot with catalog.write_snapshot() and then be read by the app as if they were downloaded.
+# The values are drawn from rough approximations of the real population (a mix of small planets and gas giants,
+# periods of days to years), and a realistic fraction of each column is missing (NaN, or '' for strings).
+# They are not meant for science.
+#
+# synthetic_delta() makes the planets that the archive would send to sync.py when some were remeasured and some were
+# discovered, and write_delta() saves them for sync.CannedArchive, to try synchronisation without the archive.
+
+import os
+import time
+from os.path import join
+
+import numpy as np
+
+from catalog import COLUMNS, STRING_COLUMNS
+
+MJ_PER_ME = 317.828#Jupiter mass over Earth mass.
+RJ_PER_RE = 11.209#Jupiter radius over Earth radius.
+RHO_JUPITER = 1.326#g/cm3
+
+#Roughly the fraction of each column that is missing in the archive table.
+NAN_FRACTIONS = {
+    'pl_massj': 0.55,
+    'pl_radj': 0.2,
+    'pl_orbper': 0.02,
+    'pl_orbeccen': 0.5,
+    'pl_orbsmax': 0.1,
+    'pl_dens': 0.6,
+    'st_teff': 0.05,
+    'st_rad': 0.07,
+    'st_metfe': 0.3,
+    'st_spstr': 0.6,
+    'gaia_gmag': 0.1,
+    'st_j': 0.03,
+    'st_k': 0.03,
+}
+
+
+def _spectral_type(teff):
+    """The main-sequence spectral class (e.g. 'G2 V') for effective temperatures teff, roughly."""
+    bounds = np.array([3700, 5200, 6000, 7500, 10000, 30000])
+    classes = np.array(list('MKGFABO'))
+    letter = classes[np.searchsorted(bounds, teff)]
+    return(np.char.add(np.char.add(letter, (np.abs(teff*7) % 10).astype(int).astype(str)), ' V'))
+
+
+def synthetic_catalog(n, seed=0, nan_fractions=NAN_FRACTIONS):
+    """Returns a catalog of n made-up planets, as a dict of column name -> array like in catalog.py.
+    The same n and seed always give the same catalog."""
+    r = np.random.default_rng(seed)
+    giant = r.random(n) < 0.3
+    #Radii: super-Earths and sub-Neptunes around 2 Re, and gas giants around 1.2 Rj.
+    rade = np.where(giant, 10**r.normal(np.log10(1.2*RJ_PER_RE), 0.1, n), 10**r.normal(np.log10(2.2), 0.2, n))
+    #Masses: a mass-radius relation for the small planets, and anything from Saturn to brown dwarfs for the giants.
+    masse = np.where(giant, 10**r.normal(0, 0.45, n)*MJ_PER_ME, rade**2.06*10**r.normal(0, 0.15, n))
+    teff = np.clip(r.normal(5500, 900, n), 2600, 12000)
+    strad = np.clip((teff/5772)**1.2*10**r.normal(0, 0.12, n), 0.1, 20)
+    period = np.clip(10**r.normal(0.9, 0.6, n), 0.2, 1e5)
+    smax = (period/365.25)**(2/3)*(teff/5772)**0.5#Kepler's third law, with a stellar mass that scales with Teff.
+    gmag = np.clip(r.normal(13, 2, n), 3, 20)
+    jmag = gmag-1.0-0.3*(5800-teff)/1000+r.normal(0, 0.1, n)
+
+    catalog = {
+        'pl_name': np.char.add(np.char.add('SYN-', np.arange(n).astype(str)), ' b'),
+        'pl_tranflag': r.random(n) < 0.9,
+        'pl_massj': masse/MJ_PER_ME,
+        'pl_masse': masse,
+        'pl_radj': rade/RJ_PER_RE,
+        'pl_rade': rade,
+        'pl_orbper': period,
+        'pl_orbeccen': r.beta(0.867, 3.03, n),
+        'pl_orbsmax': smax,
+        'pl_dens': RHO_JUPITER*(masse/MJ_PER_ME)/(rade/RJ_PER_RE)**3,
+        'pl_disc': r.integers(1995, 2026, n).astype(np.float64),
+        'st_teff': teff,
+        'st_rad': strad,
+        'st_metfe': r.normal(0, 0.2, n),
+        'st_spstr': _spectral_type(teff),
+        'gaia_gmag': gmag,
+        'st_j': jmag,
+        'st_k': jmag-0.35-0.1*(5800-teff)/1000+r.normal(0, 0.05, n),
+    }
+
+    #Knock out values at random. The mass and radius in Earth units are missing where those in Jupiter units are.
+    for name, fraction in nan_fractions.items():
+        missing = r.random(n) < fraction
+        if name in STRING_COLUMNS:
+            catalog[name][missing] = ''
+        else:
+            catalog[name][missing] = np.nan
+    catalog['pl_masse'][np.isnan(catalog['pl_massj'])] = np.nan
+    catalog['pl_rade'][np.isnan(catalog['pl_radj'])] = np.nan
+    return({name: np.ascontiguousarray(catalog[name]) for name in COLUMNS})
+
+
+def synthetic_delta(catalog, n_updated, n_added, seed=1, date=None):
+    """Returns a delta of the archive for catalog (see sync.py), like the archive would send: n_updated planets of
+    catalog with new values (a new mass and radius, as if remeasured), and n_added new planets. All have the
+    rowupdate date (default today)."""
+    r = np.random.default_rng(seed)
+    n = len(catalog['pl_name'])
+    updated = r.choice(n, size=min(n_updated, n), replace=False)
+    delta = {name: np.asarray(catalog[name])[updated].copy() for name in COLUMNS}
+    factor = 10**r.normal(0, 0.05, len(updated))
+    for name in ['pl_massj', 'pl_masse', 'pl_radj', 'pl_rade']:
+        delta[name] = delta[name]*factor
+    added = synthetic_catalog(n_added, seed=seed+1000)
+    added['pl_name'] = np.char.add(np.char.add('NEW-%i-' % seed, np.arange(n_added).astype(str)), ' b')
+    delta = {name: np.concatenate([delta[name], added[name]]) for name in COLUMNS}
+    delta['rowupdate'] = np.full(len(delta['pl_name']), date or time.strftime('%Y-%m-%d', time.gmtime()))
+    return(delta)
+
+
+def write_delta(delta, folder):
+    """Saves delta for sync.CannedArchive, which serves the deltas in folder as if they came from the archive."""
+    os.makedirs(folder, exist_ok=True)
+    np.savez(join(folder, 'delta-%s-%i.npz' % (delta['rowupdate'][0], len(os.listdir(folder)))), **delta)
@@ -0,0 +1,48 @@
+#Tests of sync.py. Run with: python -m pytest test_sync.py
+
+import json
+import time
+from os.path import join
+
+import numpy as np
+
+import catalog
+import sync
+import synthetic
+
+
+def _old_snapshot(path, age):
+    """Writes a small synthetic snapshot at path, made to look as if it was fetched age seconds ago."""
+    catalog.write_snapshot(synthetic.synthetic_catalog(50), path)
+    with open(join(catalog.snapshot_folder(path), catalog.META_FILE)) as f:
+        meta = json.load(f)
+    meta['fetched'] = time.time()-age
+    with open(join(catalog.snapshot_folder(path), catalog.META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+
+def test_quiet_sync_is_recorded(tmp_path):
+    path, store_path = str(tmp_path/'snapshot'), str(tmp_path/'store')
+    _old_snapshot(path, 7200)
+    asked = []
+    def fetch(since):#An archive in which nothing has changed.
+        asked.append(since)
+        return({name: np.zeros(0) for name in sync.DELTA_COLUMNS})
+    assert sync.sync_due(3600, path)
+    assert sync.sync(fetch, path, store_path, interval=3600) == (0, 0)
+    assert len(asked) == 1
+    assert not sync.sync_due(3600, path)
+    assert sync.sync(fetch, path, store_path, interval=3600) == (0, 0)
+    assert len(asked) == 1#Not asked again within the interval.
+
+
+def test_expired_snapshot_is_refreshed(tmp_path, monkeypatch):
+    path, store_path = str(tmp_path/'snapshot'), str(tmp_path/'store')
+    _old_snapshot(path, 7200)
+    monkeypatch.setattr(sync.settings, 'OFFLINE', False)
+    monkeypatch.setattr(catalog, 'fetch_archive', lambda: synthetic.synthetic_catalog(60, seed=1))
+    assert sync.expired(3600, path)
+    assert sync.refresh(3600, path, store_path)
+    assert not sync.expired(3600, path)
+    assert len(catalog.read_snapshot(path)['pl_name']) == 60
+    assert not sync.refresh(3600, path, store_path)#Not queried again before the snapshot expires.
@@ -0,0 +1,78 @@
+# The mass and radius sliders of the Bokeh app slide through the tick lists defined here.
+# This module is imported once per server process, so the tick strings are parsed only once, and not for every session.
+# It only needs numpy: the unit conversions are a table of factors (see TO_JUPITER), so that the app doesn't have to
+# import astropy (which takes longer than the rest of the start-up) unless it queries the archive.
+
+import numpy as np
+
+#The factors that convert each unit of the ticks to Jupiter and to Earth units. These are the factors of astropy.units
+#(e.g. u.earthMass.to(u.jupiterMass)), copied here so that the ticks come out exactly as they did with astropy.
+TO_JUPITER = {'Me': 0.0031463518655061432, 'Mj': 1.0, 'Re': 0.08921417781010463, 'Rj': 1.0}
+TO_EARTH = {'Me': 1.0, 'Mj': 317.8284065946748, 'Re': 1.0, 'Rj': 11.20898073093868}
+
+
+#Here comes something tricky. Masses and radii are quantities that vary relevantly over orders of magnitude, from 0 to 30Mj. There are 'special' values
+#like 1Mj, 1Re, 1.6Re, etc. These are hard to capture in a functional form with some logarithm.
+#So I hardcoded them into string arrays; in the form of a JScript function that is passed to FuncTickFormatter that is passed to the format keyword that is passed to the RangeSlider.
+#...
+#The slider is now sliding through list-indices (step = 1, min=0, max=len(list)).
+#See the RangeSlider definitions in main.py.
+#Now, why is it a problem that this is hardcoded?
+#Because there are variables that depend on the values in this list, for example the start and end of the rangeslider (i.e. the start and end index of this list, 0 and len(list)).
+#But more importantly, these values need to be queried later when the output values of the sliders are used.
+#This means that a python version of this ticker definition needs to exist, with numbers in it, with a unit of mass or kg, such that the planet database can be queried.
+#The easy way to do this is to simply copy-paste the below array var v=[...] arrays and make them python.
+#But that would be dangerous - hardcoding something like this is already bad enough.
+mass_ticker="""
+    var v=['0 Me','1 Me','2 Me','5 Me','10 Me','20 Me (0.06 Mj)','0.1 Mj (32 Me)','0.2 Mj','0.5 Mj','0.8 Mj','1 Mj','1.5 Mj','2 Mj','3 Mj','5 Mj','8 Mj','10 Mj','13 Mj','20 Mj','30 Mj','50 Mj'];
+    return v[tick]
+    """
+radius_ticker="""
+    var v=['0 Re','0.5 Re','1 Re','1.6 Re','2 Re','3 Re (0.27 Rj)','4 Re (0.36 Rj)','5 Re (0.45 Rj)','0.5 Rj','0.8 Rj','1 Rj','1.2 Rj','1.5 Rj','1.8 Rj','2 Rj','2.5 Rj','3 Rj','5 Rj'];
+    return v[tick]
+    """
+#So why not write a python script that extracts and converts these?
+#Why not?
+#Here goes. First split out (on the line breaks) the line that contains the definition var v=, replace the
+mass_ticks=mass_ticker.split('\n')[1].replace('    var v=[','').replace('];','').replace("'",'').split(',')#This is a list of strings. Well done, Python.
+radius_ticks=radius_ticker.split('\n')[1].replace('    var v=[','').replace('];','').replace("'",'').split(',')#and the same for radius....
+mass_tick_values=[]#(value, unit) of each tick.
+radius_tick_values=[]
+for i in mass_ticks:
+    value=i.split(' ')[0]#The value is always the thing that is a number before the first space.
+    unit=i.split(' ')[1]
+    if unit not in ['Me', 'Mj']:
+        print('ERROR: COULD NOT RESOLVE JScript string of mass ticks. Tried to resolve the following:')
+        print(unit)
+    mass_tick_values.append((float(value), unit))
+for i in radius_ticks:
+    value=i.split(' ')[0]#The value is always the thing that is a number before the first space.
+    unit=i.split(' ')[1]
+    if unit not in ['Re', 'Rj']:
+        print('ERROR: COULD NOT RESOLVE JScript string of radius ticks. Tried to resolve the following:')
+        print(unit)
+    radius_tick_values.append((float(value), unit))
+#The same values as plain floats, in both unit systems of the app, so that no unit conversions are needed after this.
+#The sliders are compared with the catalog in Jupiter units (see update_selection() in main.py), whatever units are shown.
+mass_ticks_mj = np.array([v*TO_JUPITER[unit] for v, unit in mass_tick_values])
+radius_ticks_rj = np.array([v*TO_JUPITER[unit] for v, unit in radius_tick_values])
+mass_ticks_me = np.array([v*TO_EARTH[unit] for v, unit in mass_tick_values])
+radius_ticks_re = np.array([v*TO_EARTH[unit] for v, unit in radius_tick_values])
+#The (mass, radius) ticks by the labels of the units buttons in main.py.
+unit_ticks = {'Jupiter': (mass_ticks_mj, radius_ticks_rj), 'Earth': (mass_ticks_me, radius_ticks_re)}
+#WHAM!
+#So.....
+#IF  YOU  EVER  WANT  TO  CHANGE  THE VALUES  OR  NUMBER  OF TICKS  IN  THE  MASS  OR  RADIUS  SLIDERS!
+#ONLY TOUCH THE JScript ARRAYS STARTING WITH var=[...], FILL THEM IN THERE WITH EITHER Me or Mj FOR EARTH OR JUPITER MASSES
+#AND Re OR Rj FOR EARTH OR JUPITER RADII. THE ABOVE RESOLVER WILL DO THE REST.
+#I love you, Python.
+#But do not touch the number of spaces before the var= thing or it will break. Do not touch any of that syntax, in fact.
+#I reproduce here how the variables should look in a working state, for safekeeping:
+#mass_ticker="""
+#    var v=['0 Me','1 Me','2 Me','5 Me','10 Me','20 Me (0.06 Mj)','0.1 Mj (32 Me)','0.2 Mj','0.5 Mj','0.8 Mj','1 Mj','1.5 Mj','2 Mj','3 Mj','5 Mj','8 Mj','10 Mj','13 Mj','20 Mj','30 Mj','50 Mj'];
+#    return v[tick]
+#    """
+#radius_ticker="""
+#    var v=['0 Re','0.5 Re','1 Re','1.6 Re','2 Re','3 Re (0.27 Rj)','4 Re (0.36 Rj)','5 Re (0.45 Rj)','0.5 Rj','0.8 Rj','1 Rj','1.2 Rj','1.5 Rj','1.8 Rj','2 Rj','2.5 Rj','3 Rj','5 Rj'];
+#    return v[tick]
+#    """
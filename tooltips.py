@@ -0,0 +1,121 @@
+# Tooltips whose contents are fetched from the server when a planet is hovered (settings.TOOLTIP_DETAILS).
+#
+# Normally, datatable and seltable carry a dozen columns for every planet that are only ever shown in the tooltip. In
+# this mode they carry only x, y and the row of the planet in the catalog, so that the page and every update are much
+# smaller. When the mouse is over a planet whose details the browser doesn't have yet, the hover tool asks the server
+# for them (through the table request, see FETCH_JS), and the server adds them to the table details (see main.py).
+# The browser keeps all details that it got, so each planet is fetched only once per session. The tooltip looks up the
+# hovered row in details (see FORMAT_JS), and shows '...' until the details have arrived, when it is drawn again (see
+# REDRAW_JS). Because the details cost nothing until they are asked for, the tooltip shows more than it used to.
+
+import json
+
+import numpy as np
+from bokeh.models import CustomJS, CustomJSHover
+
+#The columns of the catalog that the tooltip shows.
+DETAIL_COLUMNS = ['pl_name', 'pl_massj', 'pl_masse', 'pl_radj', 'pl_rade', 'pl_orbper', 'pl_orbsmax', 'pl_orbeccen',
+                  'pl_dens', 'teq', 'insol', 'st_teff', 'st_spstr', 'st_metfe', 'gaia_gmag', 'st_j', 'tsm', 'esm', 'pl_disc']
+#The number of decimals to show of each column, 3 if not given.
+DIGITS = {'teq': 0, 'insol': 1, 'st_teff': 0, 'st_metfe': 2, 'gaia_gmag': 1, 'st_j': 1, 'tsm': 1, 'esm': 1, 'pl_disc': 0}
+
+#The tooltips in both unit systems. Every field is the row of the planet, formatted by FORMAT_JS as the given column.
+TOOLTIPS = {
+    'Jupiter': [("Name", "@row{pl_name}"), ("Mass", "@row{pl_massj} Mj"), ("Radius", "@row{pl_radj} Rj")],
+    'Earth': [("Name", "@row{pl_name}"), ("Mass", "@row{pl_masse} Me"), ("Radius", "@row{pl_rade} Re")],
+}
+for unit in TOOLTIPS:
+    TOOLTIPS[unit] += [("Density", "@row{pl_dens} g/cm3"), ("P", "@row{pl_orbper} d"), ("a", "@row{pl_orbsmax} AU"),
+                       ("e", "@row{pl_orbeccen}"), ("Teq", "@row{teq} K"), ("Insolation", "@row{insol}"),
+                       ("Star", "@row{st_spstr}, @row{st_teff} K, [Fe/H] @row{st_metfe}"),
+                       ("Gmag/Jmag", "@row{gaia_gmag}/@row{st_j}"), ("TSM/ESM", "@row{tsm}/@row{esm}"), ("Discovered", "@row{pl_disc}")]
+
+
+def empty_table():
+    """Returns the data of the table details before anything was asked for."""
+    return({name: [] for name in ['row']+DETAIL_COLUMNS})
+
+
+def detail_columns(catalog, rows):
+    """Returns the details of the planets in the rows of catalog, as columns of the table details."""
+    columns = {name: catalog[name][rows] for name in DETAIL_COLUMNS}
+    columns['row'] = np.asarray(rows)
+    return(columns)
+
+
+#Looks up the hovered row (value) in details, and returns the column named in the field (format) for it.
+FORMAT_JS = """
+const digits = %s;
+const d = details.data;
+if (details._where === undefined || details._where_of !== d.row || details._where_length !== d.row.length) {
+    details._where = new Map();
+    for (let i = 0; i < d.row.length; i++) {
+        details._where.set(d.row[i], i);
+    }
+    details._where_of = d.row;
+    details._where_length = d.row.length;
+}
+const i = details._where.get(value);
+if (i === undefined) {
+    return '...';
+}
+const v = d[format][i];
+if (typeof v !== 'number') {
+    return v === '' ? '-' : v;
+}
+if (isNaN(v)) {
+    return '-';
+}
+return v.toFixed(format in digits ? digits[format] : 3);
+"""
+
+#Asks the server for the details of the hovered planets that weren't asked for yet. It also keeps where the mouse is
+#over planets of each renderer, for REDRAW_JS.
+FETCH_JS = """
+if (details._requested === undefined) {
+    details._requested = new Set();
+}
+if (details._hovered === undefined) {
+    details._hovered = new Map();
+}
+if (cb_data.index.indices.length) {
+    details._hovered.set(cb_data.renderer, cb_data.geometry);
+} else {
+    details._hovered.delete(cb_data.renderer);
+}
+const rows = cb_data.renderer.data_source.data.row;
+const wanted = [];
+for (const i of cb_data.index.indices) {
+    const r = rows[i];
+    if (r !== undefined && !details._requested.has(r)) {
+        details._requested.add(r);
+        wanted.push(r);
+    }
+}
+if (wanted.length) {
+    request.data = {row: wanted};
+}
+"""
+
+#When details have arrived, draws the tooltips that are open again, as if the mouse had moved: the hover tool redraws
+#them when the source of the planets signals an inspection.
+REDRAW_JS = """
+if (details._hovered === undefined) {
+    return;
+}
+for (const [renderer, geometry] of details._hovered) {
+    renderer.data_source.inspect.emit([renderer, {geometry}]);
+}
+"""
+
+
+def link(hover, details, request):
+    """Makes the hover tool hover (of the planets) show the tooltips from details, and ask for them through request."""
+    hover.formatters = {'@row': CustomJSHover(args=dict(details=details), code=FORMAT_JS % json.dumps(DIGITS))}
+    hover.callback = CustomJS(args=dict(details=details, request=request), code=FETCH_JS)
+    details.js_on_change('streaming', CustomJS(args=dict(details=details), code=REDRAW_JS))
+
+
+def forget(details):
+    """After the server has emptied details (e.g. because the planets have moved, see sync.py), the browser asks again."""
+    details.js_on_change('data', CustomJS(args=dict(details=details), code="details._requested = new Set();"))
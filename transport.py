@@ -0,0 +1,151 @@
+# Everything that the Bokeh app sends to the browser goes through here.
+#
+# Bokeh sends a numpy array as a compact binary buffer, but only if it is contiguous and of a type that JavaScript has
+# typed arrays for (float32/64 and integers up to 32 bits). Anything else (astropy columns, masked arrays, int64, lists)
+# is turned into a JSON list, one number at a time. So every outgoing column is converted here to a contiguous array
+# of an explicit dtype, with NaN for missing values. Columns that are only displayed (in the tooltips) don't need
+# double precision, so they are sent as float32, which halves their size.
+#
+# The size of every update is also counted, in a dict of statistics kept per session (see new_stats()), so that the
+# traffic per interaction can be checked.
+
+import logging
+
+import numpy as np
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+#The dtype in which each column of datatable and seltable is sent. Columns not listed here are sent as float64.
+#The positions are float32 as well: that's 7 significant digits, much more than a pixel.
+DTYPES = {
+    'x': np.float32,
+    'y': np.float32,
+    'P': np.float32,
+    'Mj': np.float32,
+    'Me': np.float32,
+    'Rj': np.float32,
+    'Re': np.float32,
+    'T_eq': np.float32,#Rounded to whole K.
+    'Gmag': np.float32,#Rounded to 0.1 mag.
+    'Jmag': np.float32,#Rounded to 0.1 mag.
+    'rho': np.float32,
+    'ecc': np.float32,
+    'FeH': np.float32,
+    'row': np.int32,#The row of a planet in the catalog, see tooltips.py.
+    #The grid cells of the density mode (see density.py).
+    'left': np.float32,
+    'right': np.float32,
+    'bottom': np.float32,
+    'top': np.float32,
+    'count': np.int32,
+    'alpha': np.float32,
+    'selected': np.int32,#The selected planets per bin of the histograms (see histograms.py).
+}
+
+
+def pack(data, dtypes=DTYPES):
+    """Returns a copy of the dict data in which every numeric column is a contiguous array of the dtype given in dtypes
+    (float64 if not given). Masked values become NaN. String columns are left as they are."""
+    packed = {}
+    for name, values in data.items():
+        if isinstance(values, np.ma.MaskedArray):
+            values = values.astype(np.float64).filled(np.nan)
+        values = np.asarray(values)
+        if values.dtype.kind in 'fiub':
+            values = np.ascontiguousarray(values, dtype=dtypes.get(name, np.float64))
+        packed[name] = values
+    return(packed)
+
+
+def payload_bytes(data):
+    """Estimates how many bytes the columns in the dict data take up when they are sent to the browser: the size of the
+    buffer for numeric columns, and the length of the JSON list for anything else."""
+    total = 0
+    for values in data.values():
+        values = np.asarray(values)
+        if values.dtype.kind in 'fiub':
+            total += values.nbytes
+        elif values.dtype.kind in 'US':
+            total += int(np.char.str_len(values).sum()) + 3*len(values)#Quotes and a comma per string.
+        else:
+            total += len(str(values.tolist()))
+    return(total)
+
+
+def new_stats():
+    """Returns the dict in which a session counts what it sends."""
+    return({'updates': 0, 'bytes': 0, 'last': {}})
+
+
+def record(stats, name, nbytes):
+    """Adds an update of nbytes sent to name (e.g. 'datatable') to the statistics."""
+    stats['updates'] += 1
+    stats['bytes'] += nbytes
+    stats['last'][name] = nbytes
+    metrics.count('updates_sent')
+    metrics.count('bytes_sent', nbytes)
+    log.debug('Sent %s bytes to %s (%s bytes in %s updates so far).', nbytes, name, stats['bytes'], stats['updates'])
+
+
+def send(source, data, stats, name, dtypes=DTYPES):
+    """Packs data (see pack()), counts its size and assigns it to the ColumnDataSource source."""
+    with metrics.stage('pack'):
+        data = pack(data, dtypes)
+    record(stats, name, payload_bytes(data))
+    source.data = data
+
+
+def send_columns(source, data, stats, name, dtypes=DTYPES):
+    """Like send(), but only replaces the columns in data. The other columns of source stay as they are and are not
+    sent again."""
+    with metrics.stage('pack'):
+        data = pack(data, dtypes)
+    record(stats, name, payload_bytes(data))
+    source.data.update(data)
+
+
+def stream(source, data, stats, name, dtypes=DTYPES):
+    """Like send(), but adds data to source as new rows at the end (ColumnDataSource.stream()). Only the new rows are sent."""
+    with metrics.stage('pack'):
+        data = pack(data, dtypes)
+    record(stats, name, payload_bytes(data))
+    source.stream(data)
+
+
+def patch(source, rows, data, stats, name, dtypes=DTYPES):
+    """Like send(), but replaces only the given rows of source by data (ColumnDataSource.patch()). Only the new values
+    are sent. Consecutive rows are sent as one slice, with the values as an array, which also keeps NaN intact. A row on
+    its own is sent as a plain number, which is shorter, unless it is NaN."""
+    rows = np.asarray(rows)
+    if not len(rows):
+        return
+    with metrics.stage('pack'):
+        data = pack(data, dtypes)
+    breaks = np.flatnonzero(np.diff(rows) != 1)+1
+    runs = list(zip(np.concatenate([[0], breaks]), np.concatenate([breaks, [len(rows)]])))#Where each run of consecutive rows starts and stops in rows.
+    patches = {}
+    for column, values in data.items():
+        patches[column] = []
+        for a, b in runs:
+            if b-a == 1 and not (values.dtype.kind == 'f' and np.isnan(values[a])):
+                patches[column].append((int(rows[a]), values[a].item()))
+            else:
+                patches[column].append((slice(int(rows[a]), int(rows[b-1])+1), values[a:b]))
+    for column in patches:
+        current = source.data[column]
+        if isinstance(current, np.ndarray) and not current.flags.writeable:
+            #patch() changes the column in place, and it may be a view of the shared catalog. The browser has these
+            #values already, so the copy is put in quietly, without sending the whole column again.
+            dict.__setitem__(source.data, column, current.copy())
+    record(stats, name, payload_bytes(data) + 16*len(runs)*len(data))
+    source.patch(patches)
+
+
+def send_indices(index_filter, rows, stats, name):
+    """Sets the indices of an IndexFilter to the array rows, and counts their size (a JSON list of integers)."""
+    rows = np.asarray(rows)
+    digits = np.floor(np.log10(np.maximum(rows, 1))).astype(np.int64) + 1
+    record(stats, name, int(digits.sum()) + len(rows) + 2)
+    index_filter.indices = rows.tolist()